@@ -7,15 +7,18 @@ Visualizes the dashboard for the predction model and
 
 
 # package imports
-import pandas as pd
+import os
+import time
+import flask
 import dash
 import dash_table
 import dash_html_components as html
 import dash_core_components as dcc
-from dash.dependencies import Input, Output
-from virginia_prediction_model import predict
-from virginia_optimization_model import optimize
-import plotly.express as px
+from dash.dependencies import Input, Output, State
+from forecast_cache import cached_predict, cached_optimize, default_cache
+from figures import prediction_figure
+from localities import locality_names
+import instrumentation
 
 
 # css stylesheet
@@ -24,6 +27,58 @@ external_stylesheets = ['https://codepen.io/chriddyp/pen/bWLwgP.css']
 # python dash app
 app = dash.Dash(__name__, external_stylesheets=external_stylesheets)
 
+# forecast cache hit/miss/eviction counters
+@app.server.route('/cache')
+def cache_stats():
+    return default_cache.stats()
+
+# stage timings and solver statistics, when DASHBOARD_METRICS is set
+@app.server.route('/metrics')
+def metrics():
+    return flask.Response(instrumentation.render(), \
+    mimetype='text/plain; version=0.0.4')
+
+# whole request times, including Dash's JSON serialization of the
+# callback outputs
+@app.server.before_request
+def start_request_timer():
+    if instrumentation.enabled:
+        flask.g.request_started = time.perf_counter()
+
+@app.server.after_request
+def record_request_time(response):
+    started = flask.g.get('request_started')
+    if started is not None:
+        instrumentation.observe('request_seconds', \
+        time.perf_counter() - started, path=flask.request.path)
+        instrumentation.observe('response_bytes', \
+        response.content_length or 0, (1e3, 1e4, 1e5, 1e6, 1e7), \
+        path=flask.request.path)
+    return response
+
+# optional background data refresh, every DASHBOARD_REFRESH_SECONDS,
+# from DASHBOARD_DATA_URL if set and the VDH website otherwise
+refresh_interval = float(os.environ.get('DASHBOARD_REFRESH_SECONDS', 0))
+refresher = None
+if refresh_interval > 0:
+    from data_refresher import DataRefresher
+    refresher = DataRefresher(refresh_interval, \
+    base_url=os.environ.get('DASHBOARD_DATA_URL'))
+    refresher.start()
+
+# data snapshot version and background refresh timings
+@app.server.route('/snapshot')
+def snapshot_status():
+    if refresher is not None:
+        return refresher.status()
+    import vdh_data
+    snapshot = vdh_data.current_snapshot()
+    return {'version': snapshot.version if snapshot is not None else None}
+
+# prediction charts are sent as compact WebGL figures unless
+# DASHBOARD_FIGURES=full
+compact_figures = os.environ.get('DASHBOARD_FIGURES', 'compact') != 'full'
+
 # radio buttons for state prediction vs county prediction
 state_vs_county = {
     'state level': [],
@@ -31,22 +86,39 @@ state_vs_county = {
 }
 
 # sorted list of county names
-my_counties = pd.read_csv('locality_populations.csv',names=['locality','population'])
-my_counties = my_counties.sort_values(by=['locality'])
-
-# prediction model input variables
-location = 'Virginia'
-scenario = 1
-days = 30
-custom_params = {
+my_counties = locality_names()
+
+# prediction model scenario for each scenario drop-down value
+scenarios = {
+    'average': 1,
+    'bad': 0,
+    'good': 2
+}
+
+# custom scenario parameters used when a custom rate box is left empty
+default_custom_params = {
     'theta': 0.00683125,
     'sigma': 0.072947592,
     'kappa': 0.003590055,
     'V1': 0.00364
 }
 
-# optimizatioin model input variables
-stockpile = 0
+
+# prediction model location and scenario from the current inputs; every
+# request builds its own, so sessions never share parameters
+def prediction_inputs(region, county, scenario_value, infection=None, \
+recovery=None, death=None, vaccine=None):
+    location = county if region == 'county level' and county else 'Virginia'
+
+    if scenario_value != 'custom':
+        return location, scenarios.get(scenario_value, 1)
+
+    scenario = dict(default_custom_params)
+    for name, val in (('theta', infection), ('sigma', recovery), \
+    ('kappa', death), ('V1', vaccine)):
+        if val not in (None, ''):
+            scenario[name] = float(val)
+    return location, scenario
 
 
 # html layout code
@@ -167,7 +239,7 @@ app.layout = html.Div([
             html.Label('select county'),
             dcc.Dropdown(
                 id='county-dropdown-prediction',
-                options=[{'label': k, 'value':k} for k in my_counties['locality']],
+                options=[{'label': k, 'value':k} for k in my_counties],
             ),
             
             html.Hr(),
@@ -294,168 +366,78 @@ app.layout = html.Div([
 # --------------------------------------------
 
 
-# disable county drop-down when state level is selected
-@app.callback(
+# disable county drop-down when state level is selected. This and the
+# next toggle run in the browser, so they never reach the server
+app.clientside_callback(
+    """
+    function set_stateOrCounty_status(val) {
+        return val === 'state level';
+    }
+    """,
     Output('county-dropdown-prediction','disabled'),
     Input('state-v-county-radio','value'),prevent_initial_call=True)
-def set_stateOrCounty_status(val):
-    if val == 'state level':
-        global location
-        location = 'Virginia'
-        return True
-    else:
-        return False
-
-# updates pred model location parameter
-@app.callback(
-    Output('county-dropdown-prediction','value'),
-    Input('county-dropdown-prediction','value'),prevent_initial_call=True
-)
-def update_location(val):
-    global location
-    location = val
-    return val
 
 # disables custom scenario text-boxes when custom is not selected 
-@app.callback(
+app.clientside_callback(
+    """
+    function set_scenario_custom_status(val) {
+        var disabled = val !== 'custom';
+        return [disabled, disabled, disabled, disabled];
+    }
+    """,
     Output('infection-rate','disabled'),
     Output('recovery-rate','disabled'),
     Output('death-rate','disabled'),
     Output('vaccine-rate','disabled'),
     Input('scenario-dropdown','value'),prevent_initial_call=True
 )
-def set_scenario_custom_status(val):
-    if val == 'custom':
-        return [False,False,False,False]
-    else:
-        return [True,True,True,True]
-
-# updates scenario input parameter
-@app.callback(
-    Output('scenario-dropdown','value'),
-    Input('scenario-dropdown','value'),prevent_initial_call=True
-)
-def update_scen(val):
-    global scenario
-
-    if val == 'average':
-        scenario = 1
-    elif val == 'bad':
-        scenario = 0
-    elif val == 'good':
-        scenario = 2
-    elif val =='custom':
-        scenario = custom_params
-    return val
-
-# next few functions updates custom parameter values (backend stuff)
-@app.callback(
-    Output('infection-rate','value'),
-    Input('infection-rate', 'value'),prevent_initial_call=True
-)
-def update_infection(val):
-    global custom_params
-    global scenario
-
-    custom_params['theta'] = float(val)
-    scenario = custom_params
-    return val
-
-@app.callback(
-    Output('recovery-rate','value'),
-    Input('recovery-rate','value'),prevent_initial_call=True
-)
-def update_recovery(val):
-    global custom_params
-    global scenario
-
-    custom_params['sigma'] = float(val)
-    scenario = custom_params
-    return val
-
-@app.callback(
-    Output('death-rate','value'),
-    Input('death-rate','value'),prevent_initial_call=True
-)
-def update_death(val):
-    global custom_params
-    global scenario
-
-    custom_params['kappa'] = float(val)
-    scenario = custom_params
-    return val
-
-@app.callback(
-    Output('vaccine-rate','value'),
-    Input('vaccine-rate','value'),prevent_initial_call=True
-)
-def update_vaccine(val):
-    global custom_params
-    global scenario
-
-    custom_params['V1'] = float(val)
-    scenario = custom_params
-    return val
-
-
-@app.callback(
-    Output('prediction-days','value'),
-    Input('prediction-days','value'),prevent_initial_call=True
-)
-
-# updates days input parameter
-def update_days(val):
-    global days
-
-    days = val
-    return val
 
 @app.callback(
     Output('prediction-output', 'figure'),
-    Input('predict-button','n_clicks')
+    Input('predict-button','n_clicks'),
+    State('state-v-county-radio','value'),
+    State('county-dropdown-prediction','value'),
+    State('scenario-dropdown','value'),
+    State('infection-rate','value'),
+    State('recovery-rate','value'),
+    State('death-rate','value'),
+    State('vaccine-rate','value'),
+    State('prediction-days','value'),
+    prevent_initial_call=True
 )
 # when prediction button is clicked, run prediction model
-def execute_predict(btn):
+def execute_predict(btn, region, county, scenario_value, infection, \
+recovery, death, vaccine, days):
 	changed_id = [p['prop_id'] for p in dash.callback_context.triggered][0]
 	if 'predict-button' in changed_id:
-		pred = predict(location,scenario,days) # prediction model
-		fig = px.line(pred, x = "time",  y = pred.columns[0:5])
-		fig.update_layout(title='Covid-19 Prediction Model',
-				xaxis_title='days',
-				yaxis_title='Number of people normalized',
-				transition_duration=500)
-		return fig
+		with instrumentation.span('callback.predict'):
+			location, scenario = prediction_inputs(region, county, \
+			scenario_value, infection, recovery, death, vaccine)
+			pred = cached_predict(location,scenario,days) # prediction model
+			with instrumentation.span('callback.predict.figure'):
+				return prediction_figure(pred, compact=compact_figures)
 	else:
 		return {}
 
-@app.callback(
-    Output('vaccine-stockpile','value'),
-    Input('vaccine-stockpile','value'),prevent_initial_call=True
-)
-
-# updates stockpile input parameter
-def update_stockpile(val):
-    global stockpile
-
-    stockpile = val
-    return val
-
 
 @app.callback(
 	Output("optimization-output", "children"),
-	Input("optimize-button", "n_clicks")
+	Input("optimize-button", "n_clicks"),
+	State('vaccine-stockpile','value'),
+	prevent_initial_call=True
 )
 # when optimization button is clicked, run optimiztion model
-def execute_optimize(btn):
+def execute_optimize(btn, stockpile):
 	changed_id = [p['prop_id'] for p in dash.callback_context.triggered][0]	
 	if 'optimize-button' in changed_id:
-		opt = optimize(stockpile)
+		with instrumentation.span('callback.optimize'):
+			opt = cached_optimize(stockpile or 0)
 	
-		return dash_table.DataTable(
-			id='table',
-			columns=[{"name": i, "id": i} for i in opt.columns],
-			data=opt.to_dict('records'),
-			)
+			return dash_table.DataTable(
+				id='table',
+				columns=[{"name": i, "id": i} for i in opt.columns],
+				data=opt.to_dict('records'),
+				)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,177 @@
+'''
+Prediction model backtest
+
+Starts a forecast from every historical report date, for every
+locality and scenario, the same way predict_all() starts one from the
+latest date, and compares the forecast infected and fatalities with
+the values reported in locality_cases.csv that many days later. The
+errors are summarized as MAE and MAPE by forecast horizon.
+
+Forecasts from several start dates are stacked into one ODE system
+(as batchPrediction does for the localities of one date) and the
+batches are spread over a process pool:
+
+    python backtest.py --horizon 30
+'''
+
+
+# package imports
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from ode_solvers import solve
+from vdh_data import get_snapshot
+from virginia_prediction_model import ODE_METHOD, deriv_batch, \
+initial_conditions, jacobian_batch, scenario_parameters
+
+
+# scenarios backtested by default (bad, real and good)
+SCENARIOS = (0, 1, 2)
+
+# compared compartments: (name, column of the ODE state vector)
+COMPARED = (('infected', 1), ('fatalities', 3))
+
+# start dates stacked into one ODE system
+DATES_PER_BATCH = 16
+
+
+# reported cases of every locality as dense (localities, days) arrays
+# over a daily calendar, carried forward over missing reports, with
+# the doses given up to and including each day and the populations
+def history(snapshot=None):
+    snapshot = snapshot or get_snapshot()
+    cases = snapshot.cases
+    dates = pd.date_range(cases['date'].min(), cases['date'].max(), freq='D')
+
+    daily = {}
+    for column in ('confirmed', 'fatalities', 'recovered', 'infected'):
+        daily[column] = cases.pivot_table(index='date', columns='locality', \
+        values=column, aggfunc='sum', observed=True).reindex(\
+        dates).ffill().fillna(0)
+    localities = daily['confirmed'].columns
+
+    daily = {column: table.to_numpy(dtype=float).T for column, table in \
+    daily.items()}
+    daily['doses'] = snapshot.locality_index().vaccine_cube().through(\
+    np.asarray(localities)[:, None], dates.to_numpy()[None, :]).astype(float)
+
+    population = snapshot.populations.drop_duplicates('locality').set_index(\
+    'locality')['population'].reindex(localities)
+    return dates, localities, population, daily
+
+
+# sums of absolute and percentage errors by horizon for one batch of
+# forecasts; observed has shape (forecasts, horizon + 1, compared) and
+# is NaN past the last report. Run on the process pool
+def _backtest_batch(y0, args, population, observed, method):
+    t = np.arange(observed.shape[1], dtype=float)
+    ret, _ = solve(deriv_batch, y0.ravel(), t, args, jac=jacobian_batch, \
+    method=method, bandwidth=4)
+    ret = ret.reshape(len(t), len(y0), 5)
+
+    predicted = np.stack([ret[:, :, column] for _, column in COMPARED], \
+    axis=2).transpose(1, 0, 2) * population[:, None, None]
+    error = np.abs(predicted - observed)
+    reported = ~np.isnan(observed)
+    positive = reported & (observed > 0)
+    percent = np.where(positive, error / np.where(positive, observed, 1), 0)
+    return np.nansum(error, axis=0), reported.sum(axis=0), \
+    percent.sum(axis=0), positive.sum(axis=0)
+
+
+# MAE and MAPE of the forecast infected and fatalities at each horizon
+# from 1 to `horizon` days, for each scenario, over forecasts started
+# on every `every`-th report date of every locality. Returns one row
+# per scenario, horizon and compartment
+def backtest(horizon=30, scenarios=SCENARIOS, every=1, workers=None, \
+snapshot=None, method=None):
+    snapshot = snapshot or get_snapshot()
+    dates, localities, population, daily = history(snapshot)
+    params = snapshot.locality_index().parameters().reindex(localities)
+    known = (population.notna() & params.notna().all(axis=1)).to_numpy()
+    population = population.to_numpy(dtype=float)[known]
+    daily = {column: values[known] for column, values in daily.items()}
+    params = params[known]
+
+    # observed values at each horizon, NaN past the last report
+    padded = {name: np.pad(daily[name], ((0, 0), (0, horizon)), \
+    constant_values=np.nan) for name, _ in COMPARED}
+
+    # one job per scenario and batch of start dates
+    starts = np.arange(0, len(dates) - 1, every)
+    jobs = []
+    for k, scenario in enumerate(scenarios):
+        args = scenario_parameters(params, scenario)
+        for batch in np.array_split(starts, max(1, -(-len(starts) // \
+        DATES_PER_BATCH))):
+            totals = pd.DataFrame({column: daily[column][:, batch].T.ravel() \
+            for column in ('confirmed', 'fatalities', 'recovered', 'doses')})
+            totals['population'] = np.tile(population, len(batch))
+            observed = np.stack([np.stack([padded[name][:, day:day + \
+            horizon + 1] for day in batch]).reshape(-1, horizon + 1) \
+            for name, _ in COMPARED], axis=2)
+            jobs.append((k, (initial_conditions(totals), \
+            tuple(np.tile(arg, len(batch)) for arg in args), \
+            totals['population'].to_numpy(), observed, \
+            method or ODE_METHOD)))
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        results = [_backtest_batch(*job) for _, job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_backtest_batch, \
+            *zip(*[job for _, job in jobs])))
+
+    # add up the batches of each scenario
+    rows = []
+    for k, scenario in enumerate(scenarios):
+        sums = [result for (job, _), result in zip(jobs, results) \
+        if job == k]
+        error, reported, percent, positive = (sum(part) for part in \
+        zip(*sums))
+        for i, (name, _) in enumerate(COMPARED):
+            for h in range(1, horizon + 1):
+                rows.append({
+                    'scenario': scenario,
+                    'horizon': h,
+                    'compartment': name,
+                    'mae': error[h, i] / max(reported[h, i], 1),
+                    'mape': 100 * percent[h, i] / max(positive[h, i], 1),
+                    'forecasts': int(reported[h, i])
+                })
+    return pd.DataFrame(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--horizon', type=int, default=30, help='days ' \
+    'forecast from each start date (default 30)')
+    parser.add_argument('--every', type=int, default=1, help='start a ' \
+    'forecast on every n-th report date (default 1)')
+    parser.add_argument('--scenario', type=int, action='append', \
+    choices=SCENARIOS, help='scenario to backtest (default: all)')
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--output', help='write every horizon to this csv')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    report = backtest(args.horizon, tuple(args.scenario or SCENARIOS), \
+    args.every, args.workers)
+    elapsed = time.perf_counter() - started
+    if args.output:
+        report.to_csv(args.output, index=False)
+
+    shown = report[report['horizon'].isin([1, 7, 14, 30, args.horizon])]
+    print(shown.to_string(index=False, float_format='%.1f'))
+    print('Backtested %d forecasts in %.1f s.' % (report.groupby(\
+    'scenario')['forecasts'].max().sum(), elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,4 @@
+'''
+Performance benchmarks for the dashboard backend. Run each one
+from the repository root, e.g. python -m benchmarks.locality_index
+'''
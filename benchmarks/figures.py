@@ -0,0 +1,46 @@
+'''
+Figure payload benchmark
+
+Compares the full (plotly.express, float64) and compact (Scattergl,
+float32, LTTB downsampled) prediction charts: time to build and
+serialize each one the way Dash does, serialized size, gzipped size
+and number of points sent to the browser, for the state chart and a
+one line per county chart over 360 days
+'''
+
+
+# package imports
+import gzip
+import timeit
+
+from dash._utils import to_json
+
+from figures import localities_figure, prediction_figure
+from virginia_prediction_model import predict, predict_all
+
+
+def points(fig):
+    return sum(len(trace.x) for trace in fig.data)
+
+
+def main(days=360, number=5):
+    charts = {
+        'state': (prediction_figure, predict('Virginia', 1, days)),
+        'counties': (localities_figure, predict_all(1, days))
+    }
+
+    print('%-10s %-8s %10s %12s %12s %10s' % ('chart', 'mode', \
+    'build (ms)', 'json (KB)', 'gzip (KB)', 'points'))
+    for chart, (build, pred) in charts.items():
+        for mode, compact in (('full', False), ('compact', True)):
+            seconds = timeit.timeit(lambda: to_json(build(pred, \
+            compact=compact)), number=number) / number
+            fig = build(pred, compact=compact)
+            payload = to_json(fig).encode()
+            print('%-10s %-8s %10.1f %12.1f %12.1f %10d' % (chart, mode, \
+            seconds * 1000, len(payload) / 1024, \
+            len(gzip.compress(payload)) / 1024, points(fig)))
+
+
+if __name__ == '__main__':
+    main()
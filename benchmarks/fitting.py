@@ -0,0 +1,44 @@
+'''
+Parameter fitting benchmark
+
+Fits every locality's parameters cold (from the state-wide values) for
+the day before the latest report, then fits the latest day both warm,
+starting from the previous day's fit, and cold, and compares the time
+and number of model integrations each takes
+'''
+
+
+# package imports
+import time
+
+import pandas as pd
+
+from parameter_fitting import FIT_PARAMETERS, fit_parameters
+from vdh_data import get_snapshot
+
+
+def main(window=60, workers=None):
+    latest = get_snapshot().cases['date'].max()
+    previous = latest - pd.Timedelta(days=1)
+
+    runs = {}
+    for name, as_of, starts in (('previous day, cold', previous, None), \
+    ('latest day, warm', latest, 'previous day, cold'), \
+    ('latest day, cold', latest, None)):
+        if starts is not None:
+            starts = runs[starts][0].set_index('locality')[\
+            list(FIT_PARAMETERS)].to_numpy()
+        started = time.perf_counter()
+        fitted, stats = fit_parameters(window, as_of, starts=starts, \
+        cold=starts is None, workers=workers)
+        runs[name] = (fitted, stats, time.perf_counter() - started)
+
+    print('%-20s %10s %14s %10s' % ('fit', 'time (s)', 'integrations', \
+    'cost'))
+    for name, (_, stats, seconds) in runs.items():
+        print('%-20s %10.2f %14d %10.2f' % (name, seconds, \
+        stats['integrations'], stats['cost']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+'''
+Locality index microbenchmark
+
+Times the per-request preprocessing of a county prediction (picking
+out the county's population, latest cases, vaccines and ODE
+parameters) with boolean filters over the full tables versus the
+snapshot's locality index, as the tables are scaled up by adding
+copies of every locality
+'''
+
+
+# package imports
+import timeit
+
+import pandas as pd
+
+from vdh_data import LocalityIndex, retrieve_input_data
+
+
+# copies of each table with every locality repeated `factor` times;
+# categorical locality columns stay categorical
+def scale_tables(tables, factor):
+    scaled = []
+    for table in tables:
+        categorical = isinstance(table['locality'].dtype, pd.CategoricalDtype)
+        copies = []
+        for i in range(factor):
+            copy = table.copy()
+            if i:
+                copy['locality'] = copy['locality'].astype(str) + ' ' + str(i)
+            copies.append(copy)
+        table = pd.concat(copies, ignore_index=True)
+        if categorical:
+            table['locality'] = table['locality'].astype('category')
+        scaled.append(table)
+    return scaled
+
+
+# county preprocessing the way predict() used to do it
+def filter_county(tables, location):
+    populations, cases, vaccines, parameters = tables
+    local_population = populations.loc[populations['locality']==location]
+    local_cases = cases.loc[cases['locality']==location]
+    local_cases = local_cases.loc[local_cases['date']==local_cases['date'].max()]
+    local_vaccines = vaccines.loc[vaccines['locality']==location]
+    local_parameters = parameters.loc[parameters['locality']==location]
+    return local_population, local_cases, local_vaccines, local_parameters
+
+
+# county preprocessing through the locality index
+def index_county(index, location):
+    return index.slice('populations', location), \
+    index.latest_cases(location), index.slice('vaccines', location), \
+    index.slice('parameters', location)
+
+
+def main(factors=(1, 4, 16), location='Fairfax', number=50):
+    tables = retrieve_input_data()
+
+    print('%8s %10s %14s %14s %12s' % ('factor', 'case rows', \
+    'filter (ms)', 'index (ms)', 'build (ms)'))
+    for factor in factors:
+        scaled = scale_tables(tables, factor)
+
+        build = timeit.timeit(lambda: LocalityIndex(*scaled), number=1)
+        index = LocalityIndex(*scaled)
+
+        filtered = timeit.timeit(lambda: filter_county(scaled, location), \
+        number=number) / number
+        indexed = timeit.timeit(lambda: index_county(index, location), \
+        number=number) / number
+
+        print('%8d %10d %14.3f %14.3f %12.1f' % (factor, len(scaled[1]), \
+        filtered * 1000, indexed * 1000, build * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+'''
+Snapshot memory benchmark
+
+Writes synthetic data files for each locality count, loads them into
+a snapshot in a fresh interpreter (from the csv files, then from the
+columnar store) and reports the bytes held by each table and the
+growth in resident memory, overall and per source row. Only reports;
+tests/test_memory.py holds a fixed size to a memory budget:
+
+    python -m benchmarks.memory --localities 1330,3200
+'''
+
+
+# package imports
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from synthetic_data import generate
+
+
+# run in the child interpreter, in the data directory; prints the
+# table sizes and resident memory growth as json
+CHILD = r'''
+import gc, json, os, resource, sys
+import vdh_data
+
+def resident():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+if STORE:
+    vdh_data.write_columnar()
+gc.collect()
+before = resident()
+snapshot = vdh_data.load_snapshot()
+gc.collect()
+print(json.dumps({'tables': snapshot.memory_usage(), \
+'resident': resident() - before}))
+'''
+
+
+# table sizes and resident memory growth of loading one snapshot
+def measure(directory, store):
+    env = dict(os.environ)
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env['PYTHONPATH'] = root + os.pathsep + env.get('PYTHONPATH', '')
+    env['PYTHONWARNINGS'] = 'ignore'
+    output = subprocess.run([sys.executable, '-c', 'STORE = %r\n' % store \
+    + CHILD], env=env, cwd=directory, check=True, capture_output=True, \
+    text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--localities', default='1330,3200', \
+    help='comma separated locality counts (default 1330,3200)')
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--fanout', type=int, default=4, help='vaccine ' \
+    'rows per locality and day (default 4)')
+    args = parser.parse_args()
+
+    print('%-10s %-9s %10s %12s %14s %12s %10s' % ('localities', 'source', \
+    'rows', 'cases (MB)', 'vaccines (MB)', 'rss (MB)', 'B/row'))
+    for localities in [int(n) for n in args.localities.split(',')]:
+        with tempfile.TemporaryDirectory() as directory:
+            counts = generate(directory, localities, args.days, args.fanout)
+            rows = counts['cases'] + counts['vaccines']
+            for source, store in (('csv', False), ('columnar', True)):
+                result = measure(directory, store)
+                per_row = result['resident'] / rows
+                print('%-10d %-9s %10d %12.1f %14.1f %12.1f %10.1f' % (\
+                localities, source, rows, \
+                result['tables']['cases'] / 2**20, \
+                result['tables']['vaccines'] / 2**20, \
+                result['resident'] / 2**20, per_row))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+'''
+ODE solver benchmark
+
+Wall time, function evaluations and max error against a tight Radau
+reference for every ode_solvers backend, over the 30-360 day periods
+the dashboard offers. Runs both the single state-level system and
+the batched all-localities system, then names the fastest backend
+that stays within tolerance for each
+'''
+
+
+# package imports
+import sys
+import timeit
+
+import numpy as np
+
+import ode_solvers
+from virginia_prediction_model import deriv, deriv_batch, jacobian, \
+jacobian_batch, initial_conditions, scenario_parameters, state_totals, \
+STATE_PARAMETERS
+from vdh_data import get_snapshot
+
+import pandas as pd
+
+
+# (name, fun, jac, y0, args, bandwidth) for each system benchmarked
+def systems(scenario):
+    snapshot = get_snapshot()
+    index = snapshot.locality_index()
+
+    state = state_totals(snapshot.populations, snapshot.cases, \
+    snapshot.vaccines)
+    state_params = pd.DataFrame(STATE_PARAMETERS, index=['Virginia'])
+    state_args = tuple(float(a[0]) for a in \
+    scenario_parameters(state_params, scenario))
+
+    totals = index.totals()
+    county_args = scenario_parameters(index.parameters().reindex(\
+    totals.index), scenario)
+
+    return [
+        ('state', deriv, jacobian, initial_conditions(state)[0], \
+        state_args, None),
+        ('all localities', deriv_batch, jacobian_batch, \
+        initial_conditions(totals).ravel(), county_args, 4)
+    ]
+
+
+def main(scenario=1, periods=range(30, 361, 30), tolerance=1e-6, repeat=3):
+    for name, fun, jac, y0, args, bandwidth in systems(scenario):
+        print('\n' + name + ' (scenario ' + str(scenario) + ')')
+        print('%7s %8s %10s %8s %12s' % ('period', 'method', 'time (ms)', \
+        'nfev', 'max error'))
+
+        best = {}
+        for period in periods:
+            t = np.linspace(0, period, period)
+            reference = ode_solvers.reference_solution(fun, y0, t, args, jac)
+
+            for method in ode_solvers.METHODS:
+                solve = lambda: ode_solvers.solve(fun, y0, t, args, jac=jac, \
+                method=method, bandwidth=bandwidth)
+                elapsed = min(timeit.repeat(solve, number=1, repeat=repeat))
+                ret, stats = solve()
+                error = float(np.abs(ret - reference).max())
+
+                print('%7d %8s %10.2f %8d %12.2e' % (period, method, \
+                elapsed * 1000, stats['nfev'], error))
+                if error <= tolerance:
+                    best.setdefault(method, 0.0)
+                    best[method] += elapsed
+                else:
+                    best[method] = float('inf')
+
+        fastest = min(best, key=best.get)
+        print('fastest within %.0e: %s' % (tolerance, fastest))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
@@ -0,0 +1,108 @@
+'''
+Dashboard startup benchmark
+
+Starts a fresh interpreter for every run (as a new worker would) and
+times importing app.py, the first page layout request and the first
+prediction and optimization requests, which also load the data and
+the models. Run it from the directory holding the data files:
+
+    python -m benchmarks.startup --runs 5
+'''
+
+
+# package imports
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+
+# run in the child interpreter; prints the timings as json
+CHILD = r'''
+import json, time
+started = time.perf_counter()
+import app
+timings = {'import app': time.perf_counter() - started}
+app.default_cache.directory = CACHE_DIR
+client = app.app.server.test_client()
+
+def timed(name, request):
+    began = time.perf_counter()
+    response = request()
+    assert response.status_code == 200, response.status_code
+    timings[name] = time.perf_counter() - began
+
+timed('first layout', lambda: client.get('/_dash-layout'))
+timed('first predict', lambda: client.post('/_dash-update-component', \
+json=PREDICT))
+timed('repeat predict (cached)', lambda: client.post(\
+'/_dash-update-component', json=PREDICT))
+timings['import to first prediction'] = time.perf_counter() - started - \
+timings['repeat predict (cached)']
+timed('first optimize', lambda: client.post('/_dash-update-component', \
+json=OPTIMIZE))
+print(json.dumps(timings))
+'''
+
+# Dash callback requests the predict and optimize buttons send
+PREDICT = {
+    'output': 'prediction-output.figure',
+    'outputs': {'id': 'prediction-output', 'property': 'figure'},
+    'inputs': [{'id': 'predict-button', 'property': 'n_clicks', 'value': 1}],
+    'changedPropIds': ['predict-button.n_clicks'],
+    'state': [
+        {'id': 'state-v-county-radio', 'property': 'value', \
+        'value': 'state level'},
+        {'id': 'county-dropdown-prediction', 'property': 'value'},
+        {'id': 'scenario-dropdown', 'property': 'value', 'value': 'average'},
+        {'id': 'infection-rate', 'property': 'value'},
+        {'id': 'recovery-rate', 'property': 'value'},
+        {'id': 'death-rate', 'property': 'value'},
+        {'id': 'vaccine-rate', 'property': 'value'},
+        {'id': 'prediction-days', 'property': 'value', 'value': 30}
+    ]
+}
+OPTIMIZE = {
+    'output': 'optimization-output.children',
+    'outputs': {'id': 'optimization-output', 'property': 'children'},
+    'inputs': [{'id': 'optimize-button', 'property': 'n_clicks', \
+    'value': 1}],
+    'changedPropIds': ['optimize-button.n_clicks'],
+    'state': [{'id': 'vaccine-stockpile', 'property': 'value', \
+    'value': 100000}]
+}
+
+
+# timings of one cold start, with an empty forecast cache so the first
+# requests really run the models
+def cold_start():
+    env = dict(os.environ)
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env['PYTHONPATH'] = root + os.pathsep + env.get('PYTHONPATH', '')
+    env['PYTHONWARNINGS'] = 'ignore'
+    with tempfile.TemporaryDirectory() as cache_dir:
+        code = 'PREDICT = %r\nOPTIMIZE = %r\nCACHE_DIR = %r\n' % \
+        (PREDICT, OPTIMIZE, cache_dir) + CHILD
+        output = subprocess.run([sys.executable, '-c', code], env=env, \
+        check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    runs = [cold_start() for _ in range(args.runs)]
+    print('%-26s %11s %11s' % ('stage', 'min (ms)', 'median (ms)'))
+    for name in runs[0]:
+        times = [run[name] for run in runs]
+        print('%-26s %11.1f %11.1f' % (name, min(times) * 1000, \
+        statistics.median(times) * 1000))
+
+
+if __name__ == '__main__':
+    main()
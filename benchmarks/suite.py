@@ -0,0 +1,172 @@
+'''
+Backend benchmark suite
+
+Times data loading, state and county predictions for every scenario
+and period, the optimization model and prediction figure building,
+at the current data size and at scaled sizes (every locality copied
+`scale` times). Reports min/median wall time and peak traced memory
+per benchmark, asv style, and can save the results to a baseline
+file and compare a later run against it:
+
+    python -m benchmarks.suite --save before
+    python -m benchmarks.suite --compare before
+
+--data runs it against the files in another directory, e.g. ones
+written by synthetic_data.py
+'''
+
+
+# package imports
+import argparse
+import json
+import os
+import statistics
+import time
+import tracemalloc
+
+import vdh_data
+from benchmarks.locality_index import scale_tables
+from figures import prediction_figure
+from virginia_optimization_model import optimize, state_optimization_model
+from virginia_prediction_model import predict
+
+
+# saved results live here, one json file per name
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+
+# scenarios and periods the dashboard offers
+SCENARIOS = {
+    'bad': 0,
+    'real': 1,
+    'good': 2,
+    'custom': {'theta': 0.00683125, 'sigma': 0.072947592, \
+    'kappa': 0.003590055, 'V1': 0.00364}
+}
+PERIODS = (30, 180, 360)
+
+
+# min/median seconds over `repeat` calls and peak memory of one call
+def measure(func, repeat):
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - started)
+
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {'min': min(times), 'median': statistics.median(times), \
+    'peak_bytes': peak}
+
+
+# (name, function) pairs benchmarked against the current snapshot
+def benchmarks(snapshot, county):
+    populations, cases, vaccines, parameters = snapshot.tables()
+    pred = predict('Virginia', 1, 360)
+
+    yield 'state_optimization_model', lambda: state_optimization_model(\
+    1000000, populations, cases, vaccines)
+    yield 'optimize', lambda: optimize(1000000)
+    yield 'prediction_figure', lambda: prediction_figure(pred)
+    yield 'prediction_figure.compact', lambda: prediction_figure(pred, \
+    compact=True)
+    for label, scenario in SCENARIOS.items():
+        for period in PERIODS:
+            yield 'predict.state.%s.%d' % (label, period), \
+            lambda s=scenario, p=period: predict('Virginia', s, p)
+            yield 'predict.county.%s.%d' % (label, period), \
+            lambda s=scenario, p=period: predict(county, s, p)
+
+
+def run(scales, repeat, county='Fairfax'):
+    results = {}
+    populations = vdh_data.retrieve_input_data()[0]
+    if county not in set(populations['locality']):
+        county = populations['locality'].iloc[0]
+
+    # loading from the source files, then from the in-memory snapshot
+    results['load_snapshot.x1'] = measure(vdh_data.load_snapshot, repeat)
+    results['retrieve_input_data.x1'] = measure(\
+    vdh_data.retrieve_input_data, repeat)
+
+    base = vdh_data.load_snapshot()
+    vdh_data.set_auto_reload(False)
+    try:
+        for scale in scales:
+            tables = scale_tables(base.tables(), scale) if scale > 1 \
+            else base.tables()
+            snapshot = vdh_data.Snapshot(base.version + '-x' + str(scale), \
+            *tables)
+            vdh_data.swap_snapshot(snapshot)
+            results['locality_index.x%d' % scale] = measure(\
+            lambda: vdh_data.LocalityIndex(*tables), 1)
+            snapshot.locality_index()
+
+            for name, func in benchmarks(snapshot, county):
+                results['%s.x%d' % (name, scale)] = measure(func, repeat)
+    finally:
+        vdh_data.set_auto_reload(True)
+        vdh_data.swap_snapshot(None)
+    return results
+
+
+# flag benchmarks more than `threshold` times slower than the baseline,
+# ignoring differences under `noise` seconds
+def report(results, baseline=None, threshold=1.2, noise=0.002):
+    print('%-40s %11s %11s %11s %9s' % ('benchmark', 'min (ms)', \
+    'median (ms)', 'peak (MB)', 'vs base'))
+    regressions = []
+    for name, result in results.items():
+        ratio = ''
+        if baseline and name in baseline:
+            change = result['min'] / baseline[name]['min']
+            ratio = '%.2fx' % change
+            if change > threshold and \
+            result['min'] - baseline[name]['min'] > noise:
+                ratio += ' !'
+                regressions.append(name)
+        print('%-40s %11.2f %11.2f %11.1f %9s' % (name, result['min'] * 1000, \
+        result['median'] * 1000, result['peak_bytes'] / 2**20, ratio))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--scale', default='1,4', help='comma separated ' \
+    'locality multipliers (default 1,4)')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--data', metavar='DIR', help='directory holding ' \
+    'the data files (default: the current one)')
+    parser.add_argument('--save', metavar='NAME', help='save the results ' \
+    'as a baseline')
+    parser.add_argument('--compare', metavar='NAME', help='compare against ' \
+    'a saved baseline')
+    args = parser.parse_args()
+
+    # baselines are written relative to the suite, not the data
+    if args.data:
+        os.chdir(args.data)
+
+    scales = [int(scale) for scale in args.scale.split(',')]
+    results = run(scales, args.repeat)
+
+    baseline = None
+    if args.compare:
+        with open(os.path.join(RESULTS_DIR, args.compare + '.json')) as f:
+            baseline = json.load(f)['results']
+    regressions = report(results, baseline)
+
+    if args.save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        with open(os.path.join(RESULTS_DIR, args.save + '.json'), 'w') as f:
+            json.dump({'created': time.time(), 'scales': scales, \
+            'results': results}, f, indent=1)
+    if regressions:
+        print('\nslower than baseline: ' + ', '.join(regressions))
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
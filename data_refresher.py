@@ -0,0 +1,100 @@
+'''
+Background data refresher
+
+Periodically downloads new VDH data, brings the columnar store up to
+date and builds a new snapshot on a background thread, then swaps it
+in with a single reference assignment. Requests never wait on a
+rebuild, and each one sees exactly one version of the data
+'''
+
+
+# package imports
+import threading
+import time
+import traceback
+
+import update_data
+import vdh_data
+
+
+# daemon thread refreshing the shared snapshot every `interval` seconds;
+# base_url fetches the datasets from somewhere other than VDH and
+# download=False only picks up files written by update_data.py
+class DataRefresher(threading.Thread):
+
+    def __init__(self, interval, download=True, base_url=None):
+        super().__init__(name='data-refresher', daemon=True)
+        self.interval = interval
+        self.download = download
+        self.datasets = update_data.datasets_at(base_url) if base_url \
+        else None
+        self._stop_event = threading.Event()
+        self._status_lock = threading.Lock()
+        self._status = {
+            'version': None,
+            'refreshes': 0,
+            'failures': 0,
+            'last_refresh': None,
+            'last_error': None,
+            'timings': {}
+        }
+
+    # build the first snapshot up front, then refresh on the interval
+    def run(self):
+        vdh_data.set_auto_reload(False)
+        while True:
+            self.refresh()
+            if self._stop_event.wait(self.interval):
+                break
+
+    def stop(self):
+        self._stop_event.set()
+
+    # one refresh cycle, with the time spent in each stage. A failed
+    # download still lets files already on disk be picked up. Only one
+    # process downloads and writes the store at a time; while another
+    # one is, this one skips the download and just reloads the data
+    def refresh(self):
+        timings = {}
+        errors = []
+
+        started = time.perf_counter()
+        if self.download:
+            with vdh_data.store_lock(blocking=False) as locked:
+                try:
+                    if locked:
+                        changed = update_data.update(self.datasets)
+                        if changed or vdh_data.columnar_manifest() is None:
+                            vdh_data.append_columnar()
+                except Exception:
+                    errors.append(traceback.format_exc())
+        timings['download'] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        try:
+            current = vdh_data.current_snapshot()
+            fingerprint = vdh_data.source_fingerprint()
+            if current is None or \
+            vdh_data.data_version(fingerprint) != current.version:
+                vdh_data.swap_snapshot(vdh_data.build_snapshot())
+        except Exception:
+            errors.append(traceback.format_exc())
+        timings['build'] = time.perf_counter() - started
+
+        with self._status_lock:
+            current = vdh_data.current_snapshot()
+            self._status['version'] = current.version if current else None
+            self._status['refreshes'] += 1
+            self._status['last_refresh'] = time.time()
+            self._status['timings'] = timings
+            if errors:
+                self._status['failures'] += 1
+                self._status['last_error'] = errors[-1]
+
+    # current snapshot version and the last refresh's timings
+    def status(self):
+        with self._status_lock:
+            status = dict(self._status)
+            status['timings'] = dict(self._status['timings'])
+        status['interval'] = self.interval
+        return status
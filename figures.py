@@ -0,0 +1,125 @@
+'''
+Dashboard figures
+
+Builds the Plotly figures the dashboard shows for model results.
+Each figure has a full mode (plotly.express, every point as float64)
+and a compact mode for the wire: WebGL Scattergl traces, float32
+values and long series downsampled with Largest-Triangle-Three-Buckets
+(LTTB), which keeps the peaks and turns of each curve
+'''
+
+
+# package imports
+import numpy as np
+
+
+# most points per trace in compact mode
+MAX_POINTS = 200
+
+# model output columns that are plotted
+COMPARTMENTS = ["Susceptible Population", "Infected with COVID-19", \
+"Recovered from COVID-19", "Fatalities", "Vaccinated Population"]
+
+# axis and title text shared by both modes
+PREDICTION_LAYOUT = {
+    'title': 'Covid-19 Prediction Model',
+    'xaxis_title': 'days',
+    'yaxis_title': 'Number of people normalized',
+    'transition_duration': 500
+}
+
+
+# row indices LTTB keeps when reducing each column of y (shape (n,) or
+# (n, series), sampled at the shared, increasing x) to `threshold`
+# points; returns an array of shape (threshold, series)
+def lttb_indices(x, y, threshold):
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float).reshape(len(x), -1)
+    n, series = y.shape
+    if threshold >= n or threshold < 3:
+        return np.tile(np.arange(n)[:, None], (1, series))
+
+    # first and last points are always kept; the rest come one from
+    # each of threshold - 2 equal buckets
+    edges = (np.arange(threshold - 1) * (n - 2) / (threshold - 2)).astype(\
+    int) + 1
+    edges[-1] = n - 1
+    columns = np.arange(series)
+    keep = np.empty((threshold, series), dtype=int)
+    keep[0] = 0
+    keep[-1] = n - 1
+
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        following = slice(end, edges[i + 2]) if i + 2 < len(edges) \
+        else slice(n - 1, n)
+        avg_x = x[following].mean()
+        avg_y = y[following].mean(axis=0)
+
+        # the point making the largest triangle with the previously
+        # kept point and the average of the next bucket
+        ax, ay = x[keep[i]], y[keep[i], columns]
+        area = np.abs((ax - avg_x) * (y[start:end] - ay) - \
+        (ax - x[start:end, None]) * (avg_y - ay))
+        keep[i + 1] = start + area.argmax(axis=0)
+    return keep
+
+
+# one WebGL line per column of y, downsampled and stored as float32
+def compact_traces(x, y, names, max_points=MAX_POINTS):
+    import plotly.graph_objects as go
+
+    x = np.asarray(x)
+    y = np.asarray(y).reshape(len(x), -1)
+    keep = lttb_indices(x, y, max_points)
+    return [go.Scattergl(x=x[keep[:, j]].astype(np.float32), \
+    y=y[keep[:, j], j].astype(np.float32), name=name, mode='lines') \
+    for j, name in enumerate(names)]
+
+
+# line chart of a prediction model result over time; plotly is
+# imported here, on the first chart, rather than at startup
+def prediction_figure(pred, compact=False, max_points=MAX_POINTS):
+    if compact:
+        import plotly.graph_objects as go
+
+        fig = go.Figure(compact_traces(pred['time'].to_numpy(), \
+        pred[COMPARTMENTS].to_numpy(), COMPARTMENTS, max_points))
+        fig.update_layout(legend_title_text='variable', **PREDICTION_LAYOUT)
+        return fig
+
+    import plotly.express as px
+
+    fig = px.line(pred, x = "time",  y = pred.columns[0:5])
+    fig.update_layout(**PREDICTION_LAYOUT)
+    return fig
+
+
+# one line per locality for a compartment of a predict_all() result
+def localities_figure(pred, compartment="Infected with COVID-19", \
+compact=False, max_points=MAX_POINTS):
+    layout = dict(PREDICTION_LAYOUT, title=compartment + ' by locality')
+    if compact:
+        import plotly.graph_objects as go
+
+        # predict_all rows are grouped by locality, days within each
+        localities = _unique_in_order(pred['locality'].to_numpy())
+        days = len(pred) // len(localities)
+        values = pred[compartment].to_numpy().reshape(len(localities), \
+        days).T
+        fig = go.Figure(compact_traces(pred['time'].to_numpy()[:days], \
+        values, localities, max_points))
+        fig.update_layout(legend_title_text='locality', **layout)
+        return fig
+
+    import plotly.express as px
+
+    fig = px.line(pred, x='time', y=compartment, color='locality')
+    fig.update_layout(**layout)
+    return fig
+
+
+# distinct values in order of first appearance
+def _unique_in_order(values):
+    _, first = np.unique(values, return_index=True)
+    return values[np.sort(first)]
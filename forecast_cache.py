@@ -0,0 +1,190 @@
+'''
+Forecast result cache
+
+Memoizes predict() and optimize() results in a bounded in-memory LRU
+backed by pickled files on disk, so repeated dashboard requests skip
+the model entirely and results survive a restart. Keys include the
+data snapshot version, so entries go stale as soon as update_data.py
+brings in new data. The models (and pandas and SciPy with them) are
+only imported on the first cache miss, which keeps the dashboard's
+startup fast
+'''
+
+
+# package imports
+import hashlib
+import os
+import pickle
+import threading
+from collections import OrderedDict
+
+
+# on-disk tier location, relative to the working directory
+CACHE_DIR = '.forecast_cache'
+
+
+# two-tier (memory LRU + disk) result cache for one data version at a time
+class ForecastCache:
+
+    def __init__(self, maxsize=256, directory=CACHE_DIR, disk_maxsize=5000):
+        self.maxsize = maxsize
+        self.directory = directory
+        self.disk_maxsize = disk_maxsize
+        self.version = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {'hits': 0, 'disk_hits': 0, 'misses': 0, \
+        'evictions': 0, 'invalidations': 0}
+
+    # cached value for key under data version, or compute() it
+    def get_or_compute(self, key, version, compute):
+        with self._lock:
+            self._set_version(version)
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.counters['hits'] += 1
+                return self._entries[key]
+
+        value = self._read_disk(key, version)
+        if value is not None:
+            with self._lock:
+                self.counters['disk_hits'] += 1
+                self._remember(key, value)
+            return value
+
+        value = compute()
+        with self._lock:
+            self.counters['misses'] += 1
+            current = self.version == version
+            if current:
+                self._remember(key, value)
+        # results for a version superseded while computing are not kept
+        if current:
+            self._write_disk(key, version, value)
+        return value
+
+    # hit/miss/eviction counters and current sizes
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats['size'] = len(self._entries)
+            stats['version'] = self.version
+        return stats
+
+    # drop every entry, in memory and on disk
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        for name in self._disk_files():
+            _remove(os.path.join(self.directory, name))
+
+    # switching data versions empties memory and deletes older files
+    def _set_version(self, version):
+        if version == self.version:
+            return
+        if self.version is not None:
+            self.counters['invalidations'] += 1
+        self.version = version
+        self._entries.clear()
+        for name in self._disk_files():
+            if not name.startswith(version + '-'):
+                _remove(os.path.join(self.directory, name))
+
+    def _remember(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.counters['evictions'] += 1
+
+    def _path(self, key, version):
+        digest = hashlib.sha1(repr(key).encode()).hexdigest()
+        return os.path.join(self.directory, version + '-' + digest + '.pkl')
+
+    def _read_disk(self, key, version):
+        try:
+            with open(self._path(key, version), 'rb') as f:
+                stored_key, value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        return value if stored_key == key else None
+
+    # written to a temp file and renamed, so readers never see half a file
+    def _write_disk(self, key, version, value):
+        path = self._path(key, version)
+        tmp = path + '.' + str(os.getpid()) + '.' + \
+        str(threading.get_ident()) + '.tmp'
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(tmp, 'wb') as f:
+                pickle.dump((key, value), f, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, path)
+        except OSError:
+            _remove(tmp)
+            return
+
+        # keep the disk tier bounded, oldest files first
+        files = self._disk_files()
+        if len(files) > self.disk_maxsize:
+            paths = [os.path.join(self.directory, name) for name in files]
+            paths.sort(key=_mtime)
+            for old in paths[:len(paths) - self.disk_maxsize]:
+                _remove(old)
+
+    def _disk_files(self):
+        try:
+            return [name for name in os.listdir(self.directory) \
+            if name.endswith('.pkl')]
+        except OSError:
+            return []
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return 0
+
+
+# hashable, order-independent form of a prediction scenario
+def normalize_scenario(scenario):
+    if isinstance(scenario, dict):
+        return tuple(sorted((name, float(value)) for name, value in \
+        scenario.items()))
+    return scenario
+
+
+# cache shared by the dashboard callbacks
+default_cache = ForecastCache()
+
+
+# predict() with results memoized by location, scenario, period and
+# data version
+def cached_predict(location, scenario, days, cache=None):
+    import vdh_data
+    from virginia_prediction_model import predict
+
+    cache = cache or default_cache
+    key = ('predict', location, normalize_scenario(scenario), days)
+    return cache.get_or_compute(key, vdh_data.get_snapshot().version, \
+    lambda: predict(location, scenario, days))
+
+
+# optimize() with results memoized by stockpile, as-of date and data
+# version
+def cached_optimize(stockpile, cache=None, as_of=None):
+    import vdh_data
+    from virginia_optimization_model import optimize
+
+    cache = cache or default_cache
+    key = ('optimize', stockpile) if as_of is None else \
+    ('optimize', stockpile, str(as_of))
+    return cache.get_or_compute(key, vdh_data.get_snapshot().version, \
+    lambda: optimize(stockpile, as_of))
@@ -0,0 +1,166 @@
+'''
+Timing spans, histograms and counters
+
+Records how long each stage of a dashboard request takes (data
+loading, cleaning, ODE solves, frame assembly, figure building) and
+ODE solver statistics, and renders them in the Prometheus text
+format for app.py's /metrics route. Turned on by setting
+DASHBOARD_METRICS=1; when off, span() hands back a shared no-op
+context manager and nothing is recorded
+'''
+
+
+# package imports
+import os
+import threading
+import time
+from contextlib import nullcontext
+
+
+# upper bounds (seconds) of the stage duration histogram buckets
+DURATION_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, \
+0.25, 0.5, 1, 2.5, 5, 10)
+
+# upper bounds of the histogram of right hand side evaluations per solve
+EVALUATION_BUCKETS = (100, 250, 500, 1000, 2500, 5000, 10000, 25000, \
+100000)
+
+# metric name prefix
+PREFIX = 'vdh_'
+
+enabled = os.environ.get('DASHBOARD_METRICS', '') not in ('', '0')
+
+_lock = threading.Lock()
+_histograms = {}
+_counters = {}
+_idle = nullcontext()
+
+
+# cumulative bucket counts, sum and count of observed values
+class Histogram:
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+
+# times the enclosed block into the stage duration histogram
+class Span:
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe('stage_seconds', time.perf_counter() - self.started, \
+        DURATION_BUCKETS, stage=self.stage)
+        return False
+
+
+# turn recording on or off at runtime
+def set_enabled(value):
+    global enabled
+
+    enabled = value
+
+
+# context manager timing a stage, e.g. with span('predict.solve'):
+def span(stage):
+    return Span(stage) if enabled else _idle
+
+
+# add value to the histogram `name` with the given labels
+def observe(name, value, buckets=DURATION_BUCKETS, **labels):
+    if not enabled:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = Histogram(buckets)
+        histogram.observe(value)
+
+
+# add value to the counter `name` with the given labels
+def count(name, value=1, **labels):
+    if not enabled:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+# counters for one ODE solve, from the stats ode_solvers.solve returns
+def record_solver(stats):
+    if not enabled:
+        return
+    method = stats['method']
+    count('solver_solves_total', method=method)
+    count('solver_function_evaluations_total', stats['nfev'], method=method)
+    count('solver_jacobian_evaluations_total', stats['njev'], method=method)
+    count('solver_steps_total', stats['steps'], method=method)
+    if not stats['success']:
+        count('solver_failures_total', method=method)
+    observe('solver_function_evaluations', stats['nfev'], \
+    EVALUATION_BUCKETS, method=method)
+
+
+# forget everything recorded so far
+def reset():
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+
+
+# {name="value",...} label set, empty when there are no labels
+def _labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join('%s="%s"' % (name, str(value).replace('"', \
+    '\\"')) for name, value in pairs) + '}'
+
+
+# every histogram and counter in the Prometheus text exposition format
+def render():
+    with _lock:
+        histograms = sorted((key, (h.buckets, list(h.counts), h.sum, \
+        h.count)) for key, h in _histograms.items())
+        counters = sorted(_counters.items())
+
+    lines = []
+    typed = set()
+    for (name, labels), value in counters:
+        if name not in typed:
+            typed.add(name)
+            lines.append('# TYPE %s%s counter' % (PREFIX, name))
+        lines.append('%s%s%s %s' % (PREFIX, name, _labels(labels), value))
+
+    for (name, labels), (buckets, counts, total, observed) in histograms:
+        if name not in typed:
+            typed.add(name)
+            lines.append('# TYPE %s%s histogram' % (PREFIX, name))
+        cumulative = 0
+        for bound, bucket in zip(buckets, counts):
+            cumulative += bucket
+            lines.append('%s%s_bucket%s %d' % (PREFIX, name, \
+            _labels(labels, [('le', bound)]), cumulative))
+        lines.append('%s%s_bucket%s %d' % (PREFIX, name, \
+        _labels(labels, [('le', '+Inf')]), observed))
+        lines.append('%s%s_sum%s %r' % (PREFIX, name, _labels(labels), total))
+        lines.append('%s%s_count%s %d' % (PREFIX, name, _labels(labels), \
+        observed))
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,52 @@
+'''
+Locality names for the dashboard
+
+The county drop-down only needs the sorted locality names, so they
+are kept in a small JSON file next to the population dataset instead
+of parsing it with pandas at startup. The file records the size and
+modification time of the dataset it was made from and is rewritten
+whenever they change
+'''
+
+
+# package imports
+import csv
+import json
+import os
+
+
+# dataset the names come from and the file caching them
+POPULATIONS_FILE = 'locality_populations.csv'
+LOCALITIES_FILE = 'locality_names.json'
+
+
+def _source_stat(path):
+    st = os.stat(path)
+    return [st.st_mtime_ns, st.st_size]
+
+
+# sorted locality names of the population dataset, written to path
+def write_locality_names(source=POPULATIONS_FILE, path=LOCALITIES_FILE):
+    stat = _source_stat(source)
+    with open(source, newline='') as f:
+        names = sorted({row[0] for row in csv.reader(f) if row})
+
+    try:
+        with open(path + '.tmp', 'w') as f:
+            json.dump({'source': stat, 'localities': names}, f)
+        os.replace(path + '.tmp', path)
+    except OSError:
+        pass
+    return names
+
+
+# sorted locality names, from the cached file when it is current
+def locality_names(source=POPULATIONS_FILE, path=LOCALITIES_FILE):
+    try:
+        with open(path) as f:
+            cached = json.load(f)
+        if cached['source'] == _source_stat(source):
+            return cached['localities']
+    except (OSError, ValueError, KeyError):
+        pass
+    return write_locality_names(source, path)
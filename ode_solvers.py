@@ -0,0 +1,159 @@
+'''
+ODE solver backends
+
+One entry point, solve(), for integrating the prediction model's
+equations with odeint, solve_ivp (LSODA, RK45, Radau) or a fixed-step
+NumPy RK4. Every backend takes the right hand side in odeint's
+fun(y, t, *args) form and reports its function evaluation counts,
+which are also recorded by instrumentation.py when it is enabled
+'''
+
+
+# package imports
+import numpy as np
+from scipy.integrate import odeint, solve_ivp
+from scipy.sparse import issparse
+
+import instrumentation
+
+
+# available backends
+METHODS = ('odeint', 'LSODA', 'RK45', 'Radau', 'rk4')
+
+
+# integrate fun over the time grid t; returns the solution at each
+# point of t (shape (len(t), len(y0))) and a dict of solver statistics.
+# jac(y, t, *args) is the analytic Jacobian (dense or sparse), and
+# bandwidth the number of non-zero diagonals above and below the main
+# one when the system is banded
+def solve(fun, y0, t, args=(), jac=None, method='odeint', bandwidth=None, \
+rtol=None, atol=None, rk4_steps=1):
+    y0 = np.asarray(y0, dtype=float)
+    t = np.asarray(t, dtype=float)
+
+    with instrumentation.span('solve.' + str(method)):
+        if method == 'odeint':
+            ret, stats = _solve_odeint(fun, y0, t, args, jac, bandwidth, \
+            rtol, atol)
+        elif method in ('LSODA', 'RK45', 'Radau'):
+            ret, stats = _solve_ivp(fun, y0, t, args, jac, method, \
+            bandwidth, rtol, atol)
+        elif method == 'rk4':
+            ret, stats = _solve_rk4(fun, y0, t, args, rk4_steps)
+        else:
+            raise ValueError('unknown ODE method: ' + str(method))
+    instrumentation.record_solver(stats)
+    return ret, stats
+
+
+# tight-tolerance solution to measure the other backends against
+def reference_solution(fun, y0, t, args=(), jac=None):
+    return solve(fun, y0, t, args, jac, method='Radau', rtol=1e-12, \
+    atol=1e-14)[0]
+
+
+# odeint (LSODA from ODEPACK) with an optional analytic Dfun
+def _solve_odeint(fun, y0, t, args, jac, bandwidth, rtol, atol):
+    kwargs = {}
+    if rtol is not None:
+        kwargs['rtol'] = rtol
+    if atol is not None:
+        kwargs['atol'] = atol
+    if bandwidth is not None:
+        kwargs['ml'] = kwargs['mu'] = bandwidth
+
+    Dfun = None
+    if jac is not None and bandwidth is None:
+        Dfun = lambda y, t, *args: _dense(jac(y, t, *args))
+    elif jac is not None:
+        Dfun = lambda y, t, *args: _banded(jac(y, t, *args), bandwidth)
+
+    ret, info = odeint(fun, y0, t, args=args, Dfun=Dfun, full_output=True, \
+    **kwargs)
+    stats = {
+        'method': 'odeint',
+        'nfev': int(info['nfe'][-1]),
+        'njev': int(info['nje'][-1]),
+        'steps': int(info['nst'][-1]),
+        'success': info['message'] == 'Integration successful.'
+    }
+    return ret, stats
+
+
+# solve_ivp, with dense output kept in the stats as 'dense'
+def _solve_ivp(fun, y0, t, args, jac, method, bandwidth, rtol, atol):
+    kwargs = {'rtol': 1.49012e-8 if rtol is None else rtol, \
+    'atol': 1.49012e-8 if atol is None else atol}
+    banded = bandwidth is not None and method == 'LSODA'
+    if banded:
+        kwargs['lband'] = kwargs['uband'] = bandwidth
+
+    if jac is not None and banded:
+        kwargs['jac'] = lambda t, y: _banded(jac(y, t, *args), bandwidth)
+    elif jac is not None and method == 'LSODA':
+        kwargs['jac'] = lambda t, y: _dense(jac(y, t, *args))
+    elif jac is not None and method == 'Radau':
+        kwargs['jac'] = lambda t, y: jac(y, t, *args)
+
+    sol = solve_ivp(lambda t, y: fun(y, t, *args), (t[0], t[-1]), y0, \
+    method=method, t_eval=t, dense_output=True, **kwargs)
+    stats = {
+        'method': method,
+        'nfev': int(sol.nfev),
+        'njev': int(sol.njev),
+        'steps': len(sol.sol.ts) - 1 if sol.sol is not None else 0,
+        'success': bool(sol.success),
+        'dense': sol.sol
+    }
+    return sol.y.T, stats
+
+
+# classic fixed-step RK4 with rk4_steps steps per interval of t; fine
+# for the smooth, non-stiff scenarios the dashboard offers
+def _solve_rk4(fun, y0, t, args, steps):
+    ret = np.empty((len(t), len(y0)))
+    ret[0] = y = y0
+    for i in range(1, len(t)):
+        h = (t[i] - t[i - 1]) / steps
+        s = t[i - 1]
+        for _ in range(steps):
+            k1 = np.asarray(fun(y, s, *args))
+            k2 = np.asarray(fun(y + h / 2 * k1, s + h / 2, *args))
+            k3 = np.asarray(fun(y + h / 2 * k2, s + h / 2, *args))
+            k4 = np.asarray(fun(y + h * k3, s + h, *args))
+            y = y + h / 6 * (k1 + 2 * k2 + 2 * k3 + k4)
+            s += h
+        ret[i] = y
+
+    stats = {
+        'method': 'rk4',
+        'nfev': 4 * steps * (len(t) - 1),
+        'njev': 0,
+        'steps': steps * (len(t) - 1),
+        'success': bool(np.isfinite(y).all())
+    }
+    return ret, stats
+
+
+# dense copy of a (possibly sparse) Jacobian
+def _dense(J):
+    return J.toarray() if issparse(J) else np.asarray(J)
+
+
+# banded storage odeint expects: jac[i - j + mu, j] = dfun_i / dy_j
+def _banded(J, bandwidth):
+    n = J.shape[0]
+    bands = np.zeros((2 * bandwidth + 1, n))
+    if issparse(J):
+        J = J.tocoo()
+        inside = np.abs(J.row - J.col) <= bandwidth
+        bands[bandwidth + J.row[inside] - J.col[inside], J.col[inside]] = \
+        J.data[inside]
+        return bands
+
+    for k in range(-bandwidth, bandwidth + 1):
+        if k >= 0:
+            bands[bandwidth - k, k:] = np.diagonal(J, k)
+        else:
+            bands[bandwidth - k, :n + k] = np.diagonal(J, k)
+    return bands
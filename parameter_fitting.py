@@ -0,0 +1,193 @@
+'''
+Per-locality ODE parameter fitting
+
+Estimates rho, theta, sigma, kappa and V1 for every locality by least
+squares: the prediction model's deriv is integrated over the last
+`window` days of the locality's case and vaccine history, and its
+infected, recovered, fatality and vaccinated curves are matched to the
+reported ones. Localities are fitted in parallel on a process pool, and
+each fit starts from the parameters already in locality_parameters.csv,
+so a daily refit only has to move them by one day's worth of data:
+
+    python parameter_fitting.py
+'''
+
+
+# package imports
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy.optimize import least_squares
+
+from ode_solvers import solve
+from vdh_data import SOURCE_FILES, get_snapshot
+from virginia_prediction_model import STATE_PARAMETERS, deriv, jacobian
+
+
+# fitted parameters, in deriv's argument order, and their bounds
+FIT_PARAMETERS = ('rho', 'theta', 'sigma', 'kappa', 'V1')
+LOWER_BOUNDS = (0, 0, 0, 0, 0)
+UPPER_BOUNDS = (5, 1, 1, 1, 0.1)
+
+# starting point of a cold fit: the state-wide parameters
+COLD_START = (STATE_PARAMETERS['rho'], STATE_PARAMETERS['theta'], \
+STATE_PARAMETERS['sigma'], STATE_PARAMETERS['kappa'], 0.00364)
+
+# relative change in cost and parameters at which a fit stops
+TOLERANCE = 1e-6
+
+# parameters file columns, in file order
+PARAMETER_COLUMNS = ['locality', 'kappa', 'rho', 'sigma', 'theta', 'V1']
+
+
+# normalized (infected, recovered, fatalities, vaccinated) of every
+# locality for each of the `window` + 1 days up to as_of; returns the
+# localities, their populations and an array (localities, days, 4)
+def observations(window=60, as_of=None, snapshot=None):
+    snapshot = snapshot or get_snapshot()
+    cases = snapshot.cases
+    if as_of is not None:
+        cases = cases[cases['date'] <= pd.Timestamp(as_of)]
+    end = cases['date'].max()
+    dates = pd.date_range(end - pd.Timedelta(days=window), end, freq='D')
+
+    # daily values per locality, carried forward over missing reports
+    daily = {}
+    for column in ('infected', 'recovered', 'fatalities'):
+        daily[column] = cases.pivot_table(index='date', columns='locality', \
+        values=column, aggfunc='sum', observed=True).reindex(\
+        dates).ffill().fillna(0)
+    localities = daily['infected'].columns
+
+    # doses administered up to and including each day
+    daily['doses'] = pd.DataFrame(snapshot.locality_index().vaccine_cube(\
+    ).through(np.asarray(localities)[None, :], dates.to_numpy()[:, None]), \
+    index=dates, columns=localities)
+
+    population = snapshot.populations.drop_duplicates('locality').set_index(\
+    'locality')['population'].reindex(localities)
+    known = population.notna().to_numpy()
+    population = population.to_numpy(dtype=float)
+    observed = np.stack([daily[column].to_numpy().T for column in \
+    ('infected', 'recovered', 'fatalities', 'doses')], axis=2)
+    observed = observed / population[:, None, None]
+    return localities[known], population[known], observed[known]
+
+
+# model (infected, recovered, fatalities, vaccinated) curves over the
+# window for parameters p, starting from the first observed day
+def simulate(p, observed):
+    I0, R0, F0, V0 = observed[0]
+    y0 = (1 - I0 - R0 - F0 - V0, I0, R0, F0, V0)
+    t = np.arange(len(observed), dtype=float)
+    ret, _ = solve(deriv, y0, t, tuple(p), jac=jacobian)
+    return ret[:, 1:]
+
+
+# least squares fit of one locality's parameters from x0; returns the
+# parameters, the number of model integrations (including those for
+# the finite difference Jacobians) and the final cost
+def fit_locality(observed, x0):
+    scale = np.maximum(np.abs(observed).max(axis=0), 1e-9)
+    x0 = np.clip(x0, LOWER_BOUNDS, UPPER_BOUNDS)
+
+    def residuals(p):
+        return ((simulate(p, observed) - observed) / scale).ravel()
+
+    fit = least_squares(residuals, x0, bounds=(LOWER_BOUNDS, UPPER_BOUNDS), \
+    x_scale='jac', ftol=TOLERANCE, xtol=TOLERANCE)
+    return fit.x, fit.nfev + fit.njev * len(x0), fit.cost
+
+
+# fit a chunk of localities; run on the process pool
+def _fit_chunk(jobs):
+    return [fit_locality(observed, x0) for observed, x0 in jobs]
+
+
+# starting points from the current parameters file (cold starts for
+# localities it does not have)
+def warm_starts(localities, path=None):
+    try:
+        current = pd.read_csv(path or SOURCE_FILES['parameters'])
+    except OSError:
+        current = pd.DataFrame(columns=PARAMETER_COLUMNS)
+    current = current.drop_duplicates('locality').set_index('locality')
+    starts = np.tile(COLD_START, (len(localities), 1))
+    known = current.reindex(localities)[list(FIT_PARAMETERS)]
+    rows = known.notna().all(axis=1).to_numpy()
+    starts[rows] = known.to_numpy()[rows]
+    return starts
+
+
+# fitted parameters of every locality (a frame in the parameters file
+# layout) and fit statistics. starts holds one starting point per
+# locality, warm starts from the parameters file by default; cold=True
+# starts every locality from the state-wide parameters
+def fit_parameters(window=60, as_of=None, starts=None, cold=False, \
+workers=None, snapshot=None):
+    localities, population, observed = observations(window, as_of, snapshot)
+    if cold:
+        starts = np.tile(COLD_START, (len(localities), 1))
+    elif starts is None:
+        starts = warm_starts(localities)
+
+    # localities in chunks spread over the process pool
+    workers = workers or os.cpu_count() or 1
+    jobs = list(zip(observed, starts))
+    chunks = [jobs[i::workers] for i in range(min(workers, len(jobs)))]
+    if workers == 1:
+        results = [_fit_chunk(chunk) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_fit_chunk, chunks))
+
+    # undo the round-robin chunking
+    fits = [None] * len(jobs)
+    for i, chunk in enumerate(results):
+        fits[i::len(chunks)] = chunk
+
+    fitted = pd.DataFrame([fit[0] for fit in fits], columns=FIT_PARAMETERS)
+    fitted.insert(0, 'locality', list(localities))
+    stats = {
+        'localities': len(fits),
+        'integrations': int(sum(fit[1] for fit in fits)),
+        'cost': float(sum(fit[2] for fit in fits))
+    }
+    return fitted[PARAMETER_COLUMNS], stats
+
+
+# write a parameters frame over the parameters file, atomically
+def write_parameters(fitted, path=None):
+    path = path or SOURCE_FILES['parameters']
+    fitted.to_csv(path + '.tmp', index=False, float_format='%.9g')
+    os.replace(path + '.tmp', path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--window', type=int, default=60, help='days of ' \
+    'history to fit (default 60)')
+    parser.add_argument('--as-of', help='fit the history up to this date ' \
+    'instead of the latest report')
+    parser.add_argument('--cold', action='store_true', help='start from ' \
+    'the state-wide parameters instead of the current file')
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--output', help='parameters file to write ' \
+    '(default: ' + SOURCE_FILES['parameters'] + ')')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    fitted, stats = fit_parameters(args.window, args.as_of, cold=args.cold, \
+    workers=args.workers)
+    write_parameters(fitted, args.output)
+    print('Fitted %d localities in %.1f s (%d model integrations).' % \
+    (stats['localities'], time.perf_counter() - started, \
+    stats['integrations']))
+
+
+if __name__ == '__main__':
+    main()
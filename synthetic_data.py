@@ -0,0 +1,168 @@
+'''
+Synthetic VDH datasets
+
+Writes locality_cases.csv, locality_vaccines.csv,
+locality_populations.csv and locality_parameters.csv with the same
+columns and formats as the real files, for any number of localities
+(up to US county scale), days of reports and vaccine rows per
+locality and day. The output only depends on the arguments and the
+seed, so it can stand in for the real data in benchmarks and load
+tests:
+
+    python synthetic_data.py /tmp/synthetic --localities 3200 --days 365
+'''
+
+
+# package imports
+import argparse
+import itertools
+import os
+
+import numpy as np
+import pandas as pd
+
+
+# columns of each raw VDH dataset, in file order
+CASES_COLUMNS = ['Report Date', 'FIPS', 'Locality', 'VDH Health District', \
+'Total Cases', 'Hospitalizations', 'Deaths']
+VACCINES_COLUMNS = ['Administration Date', 'FIPS', 'Locality', \
+'Health District', 'Facility Type', 'Vaccine Manufacturer', 'Dose Number', \
+'Vaccine Doses Administered Count']
+PARAMETERS_COLUMNS = ['locality', 'kappa', 'rho', 'sigma', 'theta', 'V1']
+
+# VDH date format
+DATE_FORMAT = '%m/%d/%Y'
+
+# facility / manufacturer / dose combinations a locality's vaccine
+# administrations are split over each day
+FACILITY_TYPES = ['Hospital', 'Pharmacy', 'Public Health', \
+'Medical Practice', 'Other Community Health Provider']
+MANUFACTURERS = ['Pfizer', 'Moderna', 'J&J']
+DOSE_NUMBERS = [1, 2]
+VACCINE_COMBINATIONS = [(facility, manufacturer, dose) for dose, \
+manufacturer, facility in itertools.product(DOSE_NUMBERS, MANUFACTURERS, \
+FACILITY_TYPES)]
+
+# ranges the ODE parameters of the real localities fall in
+PARAMETER_RANGES = {
+    'kappa': (0.0001, 0.003),
+    'rho': (0.04, 0.25),
+    'sigma': (0.03, 0.22),
+    'theta': (0.01, 0.013),
+    'V1': (0.003, 0.007)
+}
+
+# Virginia has 133 localities
+DEFAULT_LOCALITIES = 133
+
+
+def locality_names(localities):
+    return ['Locality %04d' % (i + 1) for i in range(localities)]
+
+
+# populations, ODE parameters, cases and vaccine administrations as
+# data frames in the raw VDH layout
+def generate_tables(localities=DEFAULT_LOCALITIES, days=365, fanout=4, \
+seed=0, start='2020-11-28'):
+    if not 1 <= fanout <= len(VACCINE_COMBINATIONS):
+        raise ValueError('fanout must be between 1 and ' + \
+        str(len(VACCINE_COMBINATIONS)))
+    rng = np.random.default_rng(seed)
+
+    names = np.array(locality_names(localities), dtype=object)
+    fips = 51001 + 2 * np.arange(localities)
+    districts = np.array(['District %d' % (i // 10 + 1) for i in \
+    range(localities)], dtype=object)
+    dates = pd.date_range(start, periods=days, freq='D').strftime(DATE_FORMAT)
+
+    # county sized populations, a few large cities among many small ones
+    population = (rng.lognormal(10.3, 1.1, localities) + 1000).astype(int)
+    populations = pd.DataFrame({'locality': names, 'population': population})
+
+    parameters = pd.DataFrame({'locality': names})
+    for name, (low, high) in PARAMETER_RANGES.items():
+        parameters[name] = rng.uniform(low, high, localities).round(9)
+
+    # cumulative cases, hospitalizations and deaths, with new cases
+    # following a wave over the reporting period
+    wave = 1 + 0.8 * np.sin(np.linspace(0, 3 * np.pi, days))
+    rate = rng.uniform(1e-4, 6e-4, localities)
+    new_cases = rng.poisson(population[:, None] * rate[:, None] * \
+    wave[None, :])
+    confirmed = (population * 0.03).astype(int)[:, None] + \
+    np.cumsum(new_cases, axis=1)
+    hospitalizations = np.cumsum(rng.binomial(new_cases, 0.05), axis=1)
+    deaths = np.cumsum(rng.binomial(new_cases, 0.015), axis=1)
+
+    # report dates in order, every locality reporting on each of them
+    cases = pd.DataFrame({
+        'Report Date': np.repeat(dates, localities),
+        'FIPS': np.tile(fips, days),
+        'Locality': np.tile(names, days),
+        'VDH Health District': np.tile(districts, days),
+        'Total Cases': confirmed.T.ravel(),
+        'Hospitalizations': hospitalizations.T.ravel(),
+        'Deaths': deaths.T.ravel()
+    }, columns=CASES_COLUMNS)
+
+    # `fanout` rows per locality and day, one per facility type,
+    # manufacturer and dose number combination
+    facility, manufacturer, dose = (np.array(column, dtype=object) for \
+    column in zip(*VACCINE_COMBINATIONS[:fanout]))
+    rows = localities * fanout
+    daily_doses = population * rng.uniform(0.001, 0.004, localities) / fanout
+    vaccines = pd.DataFrame({
+        'Administration Date': np.repeat(dates, rows),
+        'FIPS': np.tile(np.repeat(fips, fanout), days),
+        'Locality': np.tile(np.repeat(names, fanout), days),
+        'Health District': np.tile(np.repeat(districts, fanout), days),
+        'Facility Type': np.tile(facility, rows // fanout * days),
+        'Vaccine Manufacturer': np.tile(manufacturer, rows // fanout * days),
+        'Dose Number': np.tile(dose, rows // fanout * days),
+        'Vaccine Doses Administered Count': rng.poisson(np.tile(\
+        np.repeat(daily_doses, fanout), days))
+    }, columns=VACCINES_COLUMNS)
+
+    return populations, parameters, cases, vaccines
+
+
+# write the four source files into directory; returns the row count
+# of each
+def generate(directory='.', localities=DEFAULT_LOCALITIES, days=365, \
+fanout=4, seed=0, start='2020-11-28'):
+    populations, parameters, cases, vaccines = generate_tables(localities, \
+    days, fanout, seed, start)
+
+    os.makedirs(directory, exist_ok=True)
+    populations.to_csv(os.path.join(directory, 'locality_populations.csv'), \
+    header=False, index=False)
+    parameters.to_csv(os.path.join(directory, 'locality_parameters.csv'), \
+    index=False)
+    cases.to_csv(os.path.join(directory, 'locality_cases.csv'), index=False)
+    vaccines.to_csv(os.path.join(directory, 'locality_vaccines.csv'), \
+    index=False)
+
+    return {'populations': len(populations), 'parameters': len(parameters), \
+    'cases': len(cases), 'vaccines': len(vaccines)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('directory', help='where to write the csv files')
+    parser.add_argument('--localities', type=int, default=DEFAULT_LOCALITIES)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--fanout', type=int, default=4, help='vaccine ' \
+    'rows per locality and day (1 to %d)' % len(VACCINE_COMBINATIONS))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--start', default='2020-11-28', help='first ' \
+    'report date')
+    args = parser.parse_args()
+
+    rows = generate(args.directory, args.localities, args.days, \
+    args.fanout, args.seed, args.start)
+    for name, count in rows.items():
+        print('%-12s %10d rows' % (name, count))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+'''
+Shared test fixtures
+
+Tests run against a small synthetic VDH dataset (synthetic_data.py)
+written to a temporary directory, with the vaccine feed running ten
+days past the last case report as the real feeds usually do
+'''
+
+
+# package imports
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(\
+__file__))))
+
+import vdh_data
+from synthetic_data import DATE_FORMAT, generate
+
+
+# repeat the last `days` days of vaccine administrations after the
+# last one, so the vaccine feed ends `days` days after the case feed
+def extend_vaccines(directory, days=10):
+    path = os.path.join(directory, 'locality_vaccines.csv')
+    vaccines = pd.read_csv(path)
+    dates = pd.to_datetime(vaccines['Administration Date'], format=DATE_FORMAT)
+    extra = vaccines[dates > dates.max() - pd.Timedelta(days=days)].copy()
+    extra['Administration Date'] = (dates[extra.index] + \
+    pd.Timedelta(days=days)).dt.strftime(DATE_FORMAT)
+    pd.concat([vaccines, extra]).to_csv(path, index=False)
+
+
+# synthetic data files, written once per test session
+@pytest.fixture(scope='session')
+def data_files(tmp_path_factory):
+    directory = str(tmp_path_factory.mktemp('vdh'))
+    generate(directory, localities=40, days=150, fanout=4, seed=1)
+    extend_vaccines(directory)
+    return directory
+
+
+# run the test in the synthetic data directory, with a fresh snapshot
+@pytest.fixture
+def data_dir(data_files, monkeypatch):
+    monkeypatch.chdir(data_files)
+    vdh_data.swap_snapshot(None)
+    vdh_data._file_hashes.clear()
+    yield data_files
+    vdh_data.swap_snapshot(None)
+    vdh_data._file_hashes.clear()
@@ -0,0 +1,90 @@
+'''
+Dashboard callback tests
+
+Prediction requests with different inputs are sent to the Dash server
+from several threads at once; each must get the figure for its own
+inputs
+'''
+
+
+# package imports
+import importlib
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import plotly
+import pytest
+
+import forecast_cache
+from figures import prediction_figure
+from virginia_prediction_model import predict
+
+
+# the Dash callback request the predict button sends
+def predict_request(region, county, scenario, rates, days):
+    infection, recovery, death, vaccine = rates
+    values = (('state-v-county-radio', region), \
+    ('county-dropdown-prediction', county), ('scenario-dropdown', scenario), \
+    ('infection-rate', infection), ('recovery-rate', recovery), \
+    ('death-rate', death), ('vaccine-rate', vaccine), \
+    ('prediction-days', days))
+    return {
+        'output': 'prediction-output.figure',
+        'outputs': {'id': 'prediction-output', 'property': 'figure'},
+        'inputs': [{'id': 'predict-button', 'property': 'n_clicks', \
+        'value': 1}],
+        'changedPropIds': ['predict-button.n_clicks'],
+        'state': [{'id': id, 'property': 'value', 'value': value} \
+        for id, value in values]
+    }
+
+
+# the app, imported in the data directory, with an empty forecast cache
+@pytest.fixture
+def dashboard(data_dir, tmp_path, monkeypatch):
+    app = importlib.import_module('app')
+    monkeypatch.setattr(forecast_cache, 'default_cache', \
+    forecast_cache.ForecastCache(directory=str(tmp_path / 'cache')))
+    return app
+
+
+def test_concurrent_predictions(dashboard):
+    first, second = dashboard.my_counties[:2]
+    no_rates = (None, None, None, None)
+    cases = [
+        ('state level', None, 'average', no_rates, 30),
+        ('state level', None, 'bad', no_rates, 45),
+        ('county level', first, 'good', no_rates, 20),
+        ('county level', second, 'average', no_rates, 60),
+        ('state level', None, 'custom', (0.01, 0.05, 0.002, 0.004), 30),
+        ('county level', first, 'custom', (0.02, None, 0.001, None), 40),
+        ('county level', second, 'custom', (None, 0.09, None, 0.001), 15),
+        ('county level', second, 'bad', no_rates, 25)
+    ]
+
+    # every thread waits for the others, so the requests overlap
+    barrier = threading.Barrier(len(cases))
+
+    def post(case):
+        client = dashboard.app.server.test_client()
+        barrier.wait()
+        response = client.post('/_dash-update-component', \
+        json=predict_request(*case))
+        assert response.status_code == 200
+        return response.get_json()['response']['prediction-output']['figure']
+
+    with ThreadPoolExecutor(max_workers=len(cases)) as pool:
+        figures = list(pool.map(post, cases))
+
+    # no two requests may get the same figure
+    assert len({json.dumps(figure, sort_keys=True) for figure in figures}) \
+    == len(cases)
+
+    for (region, county, scenario, rates, days), figure in zip(cases, figures):
+        location, params = dashboard.prediction_inputs(region, county, \
+        scenario, *rates)
+        expected = prediction_figure(predict(location, params, days), \
+        compact=dashboard.compact_figures)
+        assert figure == json.loads(json.dumps(expected, \
+        cls=plotly.utils.PlotlyJSONEncoder))
@@ -0,0 +1,43 @@
+'''
+Snapshot memory tests
+
+Loads one fixed size of synthetic data in a fresh interpreter, from
+the csv files and from the columnar store, and checks the bytes held
+by the tables and the growth in resident memory against fixed budgets
+'''
+
+
+# package imports
+import pytest
+
+from benchmarks.memory import measure
+from synthetic_data import generate
+
+
+# 200 localities over a year: 73,000 case and 292,000 vaccine rows
+LOCALITIES = 200
+DAYS = 365
+
+# most bytes held by all the snapshot tables together
+TABLES_BUDGET = 8 * 2**20
+
+# most resident memory growth of loading the snapshot, by source; csv
+# parsing leaves more behind than reading the columnar arrays
+RESIDENT_BUDGET = {
+    'csv': 40 * 2**20,
+    'columnar': 16 * 2**20
+}
+
+
+@pytest.fixture(scope='module')
+def data_files(tmp_path_factory):
+    directory = str(tmp_path_factory.mktemp('memory'))
+    generate(directory, LOCALITIES, DAYS, 4, seed=1)
+    return directory
+
+
+@pytest.mark.parametrize('source', ['csv', 'columnar'])
+def test_snapshot_memory(data_files, source):
+    result = measure(data_files, source == 'columnar')
+    assert sum(result['tables'].values()) <= TABLES_BUDGET
+    assert result['resident'] <= RESIDENT_BUDGET[source]
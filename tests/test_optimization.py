@@ -0,0 +1,140 @@
+'''
+Optimization model tests
+
+The vectorized importance scores, allocations and priority tiers are
+checked against a copy of the original per-county loop
+'''
+
+
+# package imports
+import datetime
+import operator
+
+import dateutil.relativedelta
+import numpy as np
+import pandas as pd
+import pytest
+
+import vdh_data
+from virginia_optimization_model import allocate, getPriorities, \
+importance_scores, optimize, optimization_table, state_optimization_model
+
+
+# the original state_optimization_model: importance score and
+# allocation of each county, one county at a time
+def loop_scores(population, cases, vaccines):
+    cases = cases.sort_values(by='date', ascending=False, kind='stable')
+    average_pop = sum(population['population']) / len(population)
+
+    scores = {}
+    for coun in set(cases['locality']):
+        df = cases.loc[cases['locality'] == coun]
+        county_vaccines = vaccines.loc[vaccines['locality'] == \
+        coun].doses.sum()
+        pop = population[population['locality'] == coun].iloc[0].population
+
+        # get cases over past 2 months for county
+        curr_case_date = df['date'].iloc[0].date().strftime("%Y-%m-%d")
+        d = datetime.datetime.strptime(curr_case_date, "%Y-%m-%d")
+        prev_date = d - dateutil.relativedelta.relativedelta(months=2)
+        recent_cases = df[df['date'] >= prev_date]
+
+        curr_infected = recent_cases.iloc[0].infected
+        curr_fatalities = recent_cases.iloc[0].fatalities
+        prev_infected = int(recent_cases.iloc[len(recent_cases) - 1].infected)
+        prev_fatalities = int(recent_cases.iloc[\
+        len(recent_cases) - 1].fatalities)
+
+        infected_rate = (curr_infected - prev_infected) / \
+        (prev_infected if prev_infected else 1)
+        fatality_rate = (curr_fatalities - prev_fatalities) / \
+        (prev_fatalities if prev_fatalities else 1)
+        susc = (pop - curr_infected - curr_fatalities - county_vaccines) / pop
+
+        scores[coun] = int(((8 * infected_rate) + (12 * fatality_rate) + \
+        (4 * susc)) * (pop / average_pop))
+    return scores
+
+
+def loop_model(stockpile, population, cases, vaccines):
+    scores = loop_scores(population, cases, vaccines)
+    scores = dict(sorted(scores.items(), key=operator.itemgetter(1), \
+    reverse=True))
+    imp_sum = int(sum(scores.values()))
+    allocations = {coun: int(score / imp_sum * stockpile) for coun, score \
+    in scores.items()}
+    return allocations, getPriorities(list(scores.keys())), scores
+
+
+@pytest.fixture
+def tables(data_dir):
+    return vdh_data.retrieve_input_data()
+
+
+def test_importance_scores_match_loop(tables):
+    population, cases, vaccines, _ = tables
+    expected = loop_scores(population, cases, vaccines)
+    scores = importance_scores(population, cases, vaccines)['importance']
+    assert scores.to_dict() == expected
+
+
+@pytest.mark.parametrize('stockpile', [1000, 100000])
+def test_allocations_match_loop(tables, stockpile):
+    population, cases, vaccines, _ = tables
+    expected, _, scores = loop_model(stockpile, population, cases, vaccines)
+    assert min(scores.values()) >= 0
+    allocations, _ = state_optimization_model(stockpile, population, cases, \
+    vaccines)
+
+    # the loop rounds every share down; the leftover doses now go to
+    # the largest remainders, at most one more each
+    assert sum(allocations.values()) == stockpile
+    assert allocations.keys() == expected.keys()
+    extra = np.array([allocations[c] - expected[c] for c in expected])
+    assert ((extra == 0) | (extra == 1)).all()
+    assert extra.sum() == stockpile - sum(expected.values())
+
+
+def test_priorities_match_loop(tables):
+    population, cases, vaccines, _ = tables
+    _, expected, scores = loop_model(1000, population, cases, vaccines)
+    _, priorities = state_optimization_model(1000, population, cases, \
+    vaccines)
+
+    # counties with equal scores may land on either side of a tier
+    # boundary; the scores in each tier must be the same
+    assert [len(tier) for tier in priorities] == \
+    [len(tier) for tier in expected]
+    for tier, expected_tier in zip(priorities, expected):
+        assert sorted(scores[c] for c in tier) == \
+        sorted(scores[c] for c in expected_tier)
+
+
+# optimize() output from the loop's scores: counties by score, ties by
+# name, allocated with the largest remainder rule
+def loop_optimize(stockpile, population, cases, vaccines):
+    scores = loop_scores(population, cases, vaccines)
+    ranked = pd.Series(scores).sort_index().sort_values(ascending=False, \
+    kind='stable')
+    allocations = allocate(ranked, stockpile).to_dict()
+    return optimization_table(allocations, getPriorities(list(ranked.index)))
+
+
+@pytest.mark.parametrize('stockpile', [1000, 100000])
+def test_optimize_matches_loop(tables, stockpile):
+    population, cases, vaccines, _ = tables
+    expected = loop_optimize(stockpile, population, cases, vaccines)
+    pd.testing.assert_frame_equal(optimize(stockpile), expected)
+
+
+def test_optimize_as_of_matches_loop(tables):
+    population, cases, vaccines, _ = tables
+    as_of = cases['date'].min() + pd.Timedelta(days=90)
+    expected = loop_optimize(1000, population, cases[cases['date'] <= \
+    as_of], vaccines[vaccines['date'] <= as_of])
+    pd.testing.assert_frame_equal(optimize(1000, as_of), expected)
+
+
+def test_optimize_as_of_before_first_report(tables):
+    with pytest.raises(ValueError, match='2019-01-15'):
+        optimize(1000, as_of='2019-01-15')
@@ -0,0 +1,147 @@
+'''
+Dataset download tests
+
+update_data.py fetches the synthetic data files from a local stand-in
+for the VDH server that answers conditional (If-None-Match) and range
+(Range, If-Range) requests the way the real one does
+'''
+
+
+# package imports
+import hashlib
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import update_data
+
+
+NAMES = ('locality_cases.csv', 'locality_vaccines.csv')
+
+
+# serves the server's files with an ETag of their content, and records
+# the headers of every request
+class StandInHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        name = self.path.lstrip('/')
+        self.server.requests.append((name, dict(self.headers)))
+        if name not in self.server.files:
+            self.send_error(404)
+            return
+        body = self.server.files[name]
+        etag = '"%s"' % hashlib.sha1(body).hexdigest()
+
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+
+        # a range is only served while If-Range still names this copy
+        requested = self.headers.get('Range')
+        if requested and self.headers.get('If-Range', etag) == etag:
+            start = int(requested.split('=')[1].rstrip('-'))
+            if start >= len(body):
+                self.send_response(416)
+                self.send_header('Content-Range', 'bytes */%d' % len(body))
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes %d-%d/%d' % (start, \
+            len(body) - 1, len(body)))
+            body = body[start:]
+        else:
+            self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server(data_files):
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+    httpd.files = {}
+    for name in NAMES:
+        with open(os.path.join(data_files, name), 'rb') as f:
+            httpd.files[name] = f.read()
+    httpd.requests = []
+    httpd.url = 'http://127.0.0.1:%d/' % httpd.server_address[1]
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def etag_of(body):
+    return '"%s"' % hashlib.sha1(body).hexdigest()
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def test_full_download(server, tmp_path):
+    changed = update_data.update(update_data.datasets_at(server.url), \
+    str(tmp_path))
+    assert sorted(changed) == sorted(NAMES)
+    for name in NAMES:
+        assert read(tmp_path / name) == server.files[name]
+        assert not os.path.exists(str(tmp_path / name) + '.part')
+    state = update_data.read_json(str(tmp_path / update_data.STATE_FILE))
+    assert state == {name: {'etag': etag_of(server.files[name])} \
+    for name in NAMES}
+
+
+def test_unchanged_skipped(server, tmp_path):
+    datasets = update_data.datasets_at(server.url)
+    update_data.update(datasets, str(tmp_path))
+    del server.requests[:]
+
+    assert update_data.update(datasets, str(tmp_path)) == []
+    assert sorted(headers['If-None-Match'] for _, headers in \
+    server.requests) == sorted(etag_of(server.files[name]) \
+    for name in NAMES)
+    for name in NAMES:
+        assert read(tmp_path / name) == server.files[name]
+
+
+# an interrupted download continues from the end of its .part file
+def test_partial_download_resumed(server, tmp_path):
+    name = NAMES[0]
+    body = server.files[name]
+    path = str(tmp_path / name)
+    with open(path + '.part', 'wb') as f:
+        f.write(body[:len(body) // 2])
+    update_data.write_json(path + '.part.json', {'etag': etag_of(body)})
+
+    changed, validators = update_data.download(server.url + name, path)
+    assert changed and validators == {'etag': etag_of(body)}
+    assert server.requests[-1][1]['Range'] == 'bytes=%d-' % (len(body) // 2)
+    assert read(path) == body
+    assert not os.path.exists(path + '.part')
+    assert not os.path.exists(path + '.part.json')
+
+
+# a .part file of a copy the server no longer has is thrown away
+def test_stale_partial_download_restarted(server, tmp_path):
+    name = NAMES[0]
+    old = server.files[name]
+    server.files[name] = old + b'1/1/2030,51001,Accomack,Eastern Shore,1,0,0\n'
+    path = str(tmp_path / name)
+    with open(path + '.part', 'wb') as f:
+        f.write(old[:len(old) // 2])
+    update_data.write_json(path + '.part.json', {'etag': etag_of(old)})
+
+    changed, validators = update_data.download(server.url + name, path)
+    assert changed and validators == {'etag': etag_of(server.files[name])}
+    assert server.requests[-1][1]['If-Range'] == etag_of(old)
+    assert read(path) == server.files[name]
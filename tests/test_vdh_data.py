@@ -0,0 +1,120 @@
+'''
+Data access tests
+'''
+
+
+# package imports
+import multiprocessing
+import os
+import shutil
+
+import pandas as pd
+import pytest
+
+import vdh_data
+
+
+# the cases and vaccines files as they were on `date`
+def truncate_sources(directory, date):
+    for name, column in vdh_data.RAW_DATE_COLUMNS.items():
+        path = os.path.join(directory, vdh_data.SOURCE_FILES[name])
+        raw = pd.read_csv(path)
+        dates = pd.to_datetime(raw[column], format=vdh_data.DATE_FORMAT)
+        raw[dates <= pd.Timestamp(date)].to_csv(path, index=False)
+
+
+needs_flock = pytest.mark.skipif(vdh_data.fcntl is None, \
+reason='no fcntl file locks on this platform')
+
+
+# append_columnar() under the store lock, as a refreshing worker does
+def _locked_append(directory):
+    import os
+    os.chdir(directory)
+    with vdh_data.store_lock():
+        vdh_data.append_columnar()
+
+
+@needs_flock
+def test_store_lock_excludes_other_holders(tmp_path):
+    directory = str(tmp_path / 'vdh_columns')
+    with vdh_data.store_lock(directory) as held:
+        assert held
+        with vdh_data.store_lock(directory, blocking=False) as other:
+            assert not other
+    with vdh_data.store_lock(directory, blocking=False) as again:
+        assert again
+
+
+@needs_flock
+def test_concurrent_appends(data_files, tmp_path, monkeypatch):
+    directory = str(tmp_path / 'data')
+    shutil.copytree(data_files, directory)
+    monkeypatch.chdir(directory)
+
+    context = multiprocessing.get_context('fork')
+    workers = [context.Process(target=_locked_append, args=(directory,)) \
+    for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert [worker.exitcode for worker in workers] == [0] * 4
+    assert vdh_data.verify_columnar() == []
+
+
+# an append that dies before its manifest swap leaves new partition
+# directories behind; the next append must not trip over them
+def test_append_after_interrupted_append(data_files, tmp_path, monkeypatch):
+    directory = str(tmp_path / 'data')
+    shutil.copytree(data_files, directory)
+    monkeypatch.chdir(directory)
+    truncate_sources(directory, '2021-02-14')
+    vdh_data.write_columnar()
+    shutil.copytree(data_files, directory, dirs_exist_ok=True)
+
+    def interrupted(directory, manifest):
+        raise OSError('interrupted')
+
+    with monkeypatch.context() as patched:
+        patched.setattr(vdh_data, '_write_manifest', interrupted)
+        with pytest.raises(OSError, match='interrupted'):
+            vdh_data.append_columnar()
+    assert os.path.isdir(os.path.join(vdh_data.COLUMNAR_DIR, 'cases', \
+    '2021-02.1'))
+
+    vdh_data.append_columnar()
+    assert vdh_data.verify_columnar() == []
+
+
+# a vaccine row without a locality counts toward the state total only,
+# from the csv files and from the columnar store
+@pytest.mark.parametrize('store', [False, True])
+def test_unattributed_vaccine_row(data_files, tmp_path, monkeypatch, store):
+    directory = str(tmp_path / 'data')
+    shutil.copytree(data_files, directory)
+    monkeypatch.chdir(directory)
+    path = vdh_data.SOURCE_FILES['vaccines']
+    vaccines = pd.read_csv(path)
+    blank = vaccines.iloc[:1].copy()
+    blank['Locality'] = ''
+    blank['Vaccine Doses Administered Count'] = 1000
+    pd.concat([vaccines, blank]).to_csv(path, index=False)
+    if store:
+        vdh_data.write_columnar()
+        assert vdh_data.verify_columnar() == []
+
+    vdh_data.swap_snapshot(None)
+    vdh_data._file_hashes.clear()
+    try:
+        cube = vdh_data.get_snapshot().locality_index().vaccine_cube()
+        total = int(vaccines['Vaccine Doses Administered Count'].sum())
+        assert cube.total() == total + 1000
+        assert cube.totals().sum() == total
+
+        from virginia_prediction_model import predict
+        assert len(predict('Virginia', 1, 10))
+    finally:
+        vdh_data.swap_snapshot(None)
+        vdh_data._file_hashes.clear()
@@ -1,24 +1,198 @@
 '''
 update_data.py: go to vdh website and download the most recent
 				COVID-19 data relevant to our dashboard
+
+Downloads are streamed to a .part file and renamed over the live csv
+only once complete, so the dashboard never reads a half-written file.
+Unchanged datasets are skipped with conditional requests, and an
+interrupted download resumes from its .part file on the next run.
+Pass a base url (e.g. http://127.0.0.1:8000/) to fetch the files
+from somewhere other than the VDH website.
+
+New report dates are appended to the columnar store; --full rebuilds
+it from scratch and --verify checks it against a full rebuild.
+--refit refits every locality's ODE parameters to the new data
+(see parameter_fitting.py)
 '''
 
 
+import json
 import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
 
-# update COVID-19 cases dataset
-vdh_cases='https://data.virginia.gov/api/views/bre9-aqqr/rows.csv?accessType=DOWNLOAD'
-response = requests.get(vdh_cases)
-with open(os.path.join("locality_cases.csv"), 'wb') as f:
-	f.write(response.content)
+import vdh_data
+
+
+# VDH datasets and the files they are saved to
+DATASETS = {
+	'locality_cases.csv': 'https://data.virginia.gov/api/views/bre9-aqqr/rows.csv?accessType=DOWNLOAD',
+	'locality_vaccines.csv': 'https://data.virginia.gov/api/views/28k2-x2rj/rows.csv?accessType=DOWNLOAD'
+}
+
+# dataset descriptions for progress messages
+DESCRIPTIONS = {
+	'locality_cases.csv': 'Virginia COVID-19 cases dataset',
+	'locality_vaccines.csv': 'Virginia COVID-19 vaccine administration dataset'
+}
+
+# ETag / Last-Modified of each file's last complete download
+STATE_FILE = '.vdh_download_state.json'
+
+CHUNK_SIZE = 1 << 20
+
+
+# response headers used to validate later requests for the same file
+def validators_of(response):
+	validators = {}
+	if response.headers.get('ETag'):
+		validators['etag'] = response.headers['ETag']
+	if response.headers.get('Last-Modified'):
+		validators['last_modified'] = response.headers['Last-Modified']
+	return validators
+
+
+def read_json(path):
+	try:
+		with open(path) as f:
+			return json.load(f)
+	except (OSError, ValueError):
+		return {}
+
+
+def write_json(path, data):
+	with open(path + '.tmp', 'w') as f:
+		json.dump(data, f)
+	os.replace(path + '.tmp', path)
+
+
+# stream url into path; validators are those of the copy already on
+# disk. Returns (changed, validators of the file now on disk)
+def download(url, path, validators=None, session=None, timeout=60):
+	session = session or requests
+	partial = path + '.part'
+	partial_state = partial + '.json'
+
+	# resume a previous partial download if there is one, otherwise
+	# only ask for the file if it changed since the copy on disk
+	headers = {}
+	offset = os.path.getsize(partial) if os.path.exists(partial) else 0
+	resume_from = read_json(partial_state) if offset else {}
+	if offset and resume_from:
+		headers['Range'] = 'bytes=%d-' % offset
+		headers['If-Range'] = resume_from.get('etag') or \
+		resume_from.get('last_modified')
+	elif validators and os.path.exists(path):
+		if validators.get('etag'):
+			headers['If-None-Match'] = validators['etag']
+		if validators.get('last_modified'):
+			headers['If-Modified-Since'] = validators['last_modified']
+
+	with session.get(url, headers=headers, stream=True, \
+	timeout=timeout) as response:
+		if response.status_code == 304:
+			return False, validators
+
+		# the partial file is no use if the range cannot be served
+		if response.status_code == 416:
+			os.remove(partial)
+			return download(url, path, validators, session, timeout)
+		response.raise_for_status()
+
+		# 206 continues the partial file, anything else starts over
+		if response.status_code == 206:
+			mode = 'ab'
+			current = resume_from
+		else:
+			mode = 'wb'
+			current = validators_of(response)
+			if current:
+				write_json(partial_state, current)
+
+		with open(partial, mode) as f:
+			for chunk in response.iter_content(CHUNK_SIZE):
+				f.write(chunk)
+
+	os.replace(partial, path)
+	if os.path.exists(partial_state):
+		os.remove(partial_state)
+	return True, current
+
+
+# dataset urls on another server, e.g. a local stand-in for VDH
+def datasets_at(base_url):
+	base = base_url.rstrip('/') + '/'
+	return {name: base + name for name in DATASETS}
+
+
+# fetch every dataset concurrently; returns the files that changed.
+# Prints nothing, as the dashboard's refresher calls it on every tick
+def update(datasets=None, directory='.', timeout=60):
+	datasets = datasets or DATASETS
+	state_path = os.path.join(directory, STATE_FILE)
+	state = read_json(state_path)
+
+	session = requests.Session()
+	with ThreadPoolExecutor(max_workers=len(datasets)) as pool:
+		futures = {name: pool.submit(download, url, \
+		os.path.join(directory, name), state.get(name), session, timeout) \
+		for name, url in datasets.items()}
+
+	changed = []
+	for name, future in futures.items():
+		updated, validators = future.result()
+		state[name] = validators or {}
+		if updated:
+			changed.append(name)
+
+	write_json(state_path, state)
+	return changed
+
+
+def main(argv):
+	flags = [arg for arg in argv[1:] if arg.startswith('--')]
+	urls = [arg for arg in argv[1:] if not arg.startswith('--')]
+
+	datasets = datasets_at(urls[0]) if urls else DATASETS
+
+	# waits for any dashboard worker refreshing the same files
+	with vdh_data.store_lock():
+		changed = update(datasets)
+		for name in datasets:
+			description = DESCRIPTIONS.get(name, name)
+			if name in changed:
+				print(description + ' updated!')
+			else:
+				print(description + ' unchanged, skipped.')
+
+		# bring the columnar store the models load from up to date, by
+		# appending only the new report dates unless asked for a rebuild
+		if '--full' in flags:
+			vdh_data.write_columnar()
+			print('Columnar copy of the datasets rebuilt in ' + \
+			vdh_data.COLUMNAR_DIR + '!')
+		elif changed or vdh_data.columnar_manifest() is None:
+			vdh_data.append_columnar()
+			print('New report dates added to ' + vdh_data.COLUMNAR_DIR + '!')
+
+		if '--verify' in flags:
+			mismatched = vdh_data.verify_columnar()
+			if mismatched:
+				print('Columnar store differs from a full rebuild: ' + \
+				', '.join(mismatched))
+				sys.exit(1)
+			print('Columnar store matches a full rebuild.')
 
-print('Virginia COVID-19 cases dataset updated!')
+	# warm-started from the current parameters file
+	if '--refit' in flags:
+		import parameter_fitting
+		fitted, stats = parameter_fitting.fit_parameters()
+		parameter_fitting.write_parameters(fitted)
+		print('ODE parameters refitted for %d localities!' % \
+		stats['localities'])
 
-# update COVID-19 vaccine administrations dataset
-vdh_vaccines='https://data.virginia.gov/api/views/28k2-x2rj/rows.csv?accessType=DOWNLOAD'
-response = requests.get(vdh_vaccines)
-with open(os.path.join("locality_vaccines.csv"), 'wb') as f:
-	f.write(response.content)
 
-print('Virginia COVID-19 vaccine administration dataset updated!')
+if __name__ == '__main__':
+	main(sys.argv)
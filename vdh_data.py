@@ -0,0 +1,787 @@
+'''
+Shared VDH data access
+
+Loads the cleaned cases, vaccines, population and ODE parameter
+tables once per process and keeps them in memory. The snapshot
+is keyed on a fingerprint of the source files, so it is only
+rebuilt after update_data.py writes new data
+'''
+
+
+# package imports
+import contextlib
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+import numpy as np
+import pandas as pd
+
+import instrumentation
+
+# advisory file locks, where the platform has them
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+# source files used by the prediction and optimization models
+SOURCE_FILES = {
+    'cases': 'locality_cases.csv',
+    'vaccines': 'locality_vaccines.csv',
+    'populations': 'locality_populations.csv',
+    'parameters': 'locality_parameters.csv'
+}
+
+# columnar copy of the cleaned cases and vaccines tables, written by
+# update_data.py as one .npy file per column and month partition
+COLUMNAR_DIR = 'vdh_columns'
+COLUMNAR_FORMAT = 4
+COLUMNAR_TABLES = {
+    'cases': {
+        'date': 'datetime64[ns]',
+        'locality': 'int16',
+        'confirmed': 'int32',
+        'fatalities': 'int32',
+        'recovered': 'float32',
+        'infected': 'float32'
+    },
+    'vaccines': {
+        'date': 'datetime64[ns]',
+        'locality': 'int16',
+        'dose': 'int8',
+        'doses': 'int32'
+    }
+}
+
+# date column of each raw VDH dataset
+RAW_DATE_COLUMNS = {
+    'cases': 'Report Date',
+    'vaccines': 'Administration Date'
+}
+
+# columns the models use from each raw VDH dataset and their dtypes;
+# the csv parser skips every other column
+RAW_SCHEMAS = {
+    'cases': {
+        'Report Date': 'str',
+        'Locality': 'category',
+        'Total Cases': 'int32',
+        'Deaths': 'int32'
+    },
+    'vaccines': {
+        'Administration Date': 'str',
+        'Locality': 'category',
+        'Dose Number': 'int8',
+        'Vaccine Doses Administered Count': 'int32'
+    }
+}
+
+# date format of the raw VDH datasets, so parsing skips inference
+DATE_FORMAT = '%m/%d/%Y'
+
+# current in-memory snapshot, guarded by _lock while it is rebuilt
+_lock = threading.Lock()
+_snapshot = None
+
+# when False, get_snapshot() stops checking the source files itself and
+# serves whichever snapshot was last swapped in (see data_refresher.py)
+_auto_reload = True
+
+# last known (mtime, size, hash) of each source file
+_file_hashes = {}
+
+
+# in-memory copy of the VDH datasets for one version of the files
+class Snapshot:
+
+    def __init__(self, version, populations, cases, vaccines, parameters, \
+    fingerprint=None):
+        self.version = version
+        self.fingerprint = fingerprint
+        self.populations = populations
+        self.cases = cases
+        self.vaccines = vaccines
+        self.parameters = parameters
+        self._index = None
+        self._index_lock = threading.Lock()
+
+    # same layout retrieve_input_data has always returned
+    def tables(self):
+        return [self.populations, self.cases, self.vaccines, \
+        self.parameters]
+
+    # bytes held by each table, including the locality names
+    def memory_usage(self):
+        return {name: int(table.memory_usage(deep=True).sum()) for \
+        name, table in (('populations', self.populations), \
+        ('cases', self.cases), ('vaccines', self.vaccines), \
+        ('parameters', self.parameters))}
+
+    # per-locality index over the tables, built on first use
+    def locality_index(self):
+        with self._index_lock:
+            if self._index is None:
+                with instrumentation.span('data.locality_index'):
+                    self._index = LocalityIndex(self.populations, \
+                    self.cases, self.vaccines, self.parameters)
+            return self._index
+
+
+# split a table into contiguous row ranges per locality, newest date
+# first within each locality
+def split_by_locality(table):
+    by = ['locality', 'date'] if 'date' in table else ['locality']
+    table = table.sort_values(by=by, ascending=[True] + \
+    [False] * (len(by) - 1), kind='stable').reset_index(drop=True)
+
+    localities = table['locality'].to_numpy()
+    bounds = np.flatnonzero(localities[1:] != localities[:-1]) + 1
+    starts = np.concatenate(([0], bounds)) if len(table) else bounds
+    stops = np.concatenate((bounds, [len(table)]))
+    rows = dict(zip(localities[starts], zip(starts.tolist(), \
+    stops.tolist())))
+    return table, rows
+
+
+# locality -> row range lookups over the snapshot tables, so a single
+# county's rows are sliced out directly instead of filtered
+class LocalityIndex:
+
+    def __init__(self, populations, cases, vaccines, parameters):
+        self.tables = {}
+        self.rows = {}
+        for name, table in (('populations', populations), \
+        ('cases', cases), ('vaccines', vaccines), \
+        ('parameters', parameters)):
+            self.tables[name], self.rows[name] = split_by_locality(table)
+        self._totals = None
+        self._parameters = None
+        self._growth_rates = None
+        self._vaccine_cube = None
+
+    # rows of one table for a locality (empty if it has none)
+    def slice(self, name, locality):
+        start, stop = self.rows[name].get(locality, (0, 0))
+        return self.tables[name].iloc[start:stop]
+
+    # latest-date rows of the cases table for a locality
+    def latest_cases(self, locality):
+        start, stop = self.rows['cases'].get(locality, (0, 0))
+        cases = self.tables['cases']
+        if start == stop:
+            return cases.iloc[0:0]
+        latest = cases['date'].iat[start]
+        dates = cases['date'].to_numpy()[start:stop]
+        return cases.iloc[start:start + int((dates == latest).sum())]
+
+    # per-locality forecast starting values: latest confirmed, fatalities
+    # and recovered, total doses and population
+    def totals(self):
+        if self._totals is None:
+            cases = self.tables['cases']
+            latest = cases[cases['date'] == cases.groupby('locality', \
+            observed=True)['date'].transform('max')]
+            totals = latest.groupby('locality', observed=True)[[\
+            'confirmed', 'fatalities', 'recovered']].sum()
+
+            totals['doses'] = self.vaccine_cube().totals().reindex(\
+            totals.index, fill_value=0)
+            totals['population'] = self.tables['populations'].groupby(\
+            'locality')['population'].sum().reindex(totals.index)
+            self._totals = totals
+        return self._totals
+
+    # ODE parameters indexed by locality (first row of each)
+    def parameters(self):
+        if self._parameters is None:
+            self._parameters = self.tables['parameters'].drop_duplicates(\
+            'locality').set_index('locality')
+        return self._parameters
+
+    # growth_rates() of the snapshot tables, built on first use
+    def growth_rates(self):
+        if self._growth_rates is None:
+            with instrumentation.span('data.growth_rates'):
+                self._growth_rates = growth_rates(\
+                self.tables['populations'], self.tables['cases'])
+        return self._growth_rates
+
+    # VaccineCube of the vaccines table, built on first use
+    def vaccine_cube(self):
+        if self._vaccine_cube is None:
+            with instrumentation.span('data.vaccine_cube'):
+                self._vaccine_cube = VaccineCube(self.tables['vaccines'])
+        return self._vaccine_cube
+
+
+# doses administered per locality, day and dose number as a dense
+# array of running totals, so the doses given by any date, over any
+# window of dates or of one dose number are two lookups rather than a
+# scan of the vaccines table
+class VaccineCube:
+
+    def __init__(self, vaccines):
+        codes, localities = pd.factorize(vaccines['locality'], sort=True)
+        self.localities = pd.Index(localities)
+        self.rows = {locality: i for i, locality in \
+        enumerate(self.localities)}
+        self.doses = np.unique(vaccines['dose'].to_numpy()) if 'dose' in \
+        vaccines else np.zeros(1, dtype=int)
+        dose = np.searchsorted(self.doses, vaccines['dose'].to_numpy()) \
+        if 'dose' in vaccines else np.zeros(len(vaccines), dtype=int)
+
+        dates = vaccines['date'].to_numpy(dtype='datetime64[D]')
+        self.first = dates.min() if len(dates) else np.datetime64(0, 'D')
+        days = (dates - self.first).astype(int)
+        shape = (len(self.localities), int(days.max()) + 1 if len(days) \
+        else 0, len(self.doses))
+
+        # daily doses, then running totals with a leading zero day. Rows
+        # without a locality (code -1) only count toward the state
+        weights = vaccines['doses'].to_numpy()
+        known = codes >= 0
+        daily = np.bincount(((codes * shape[1] + days) * shape[2] + \
+        dose)[known], weights=weights[known], minlength=int(np.prod(\
+        shape))).reshape(shape).astype(np.int64)
+        self.cumulative = np.zeros((shape[0], shape[1] + 1, shape[2]), \
+        dtype=np.int64)
+        np.cumsum(daily, axis=1, out=self.cumulative[:, 1:])
+
+        daily = np.bincount(days * shape[2] + dose, weights=weights, \
+        minlength=shape[1] * shape[2]).reshape(shape[1:]).astype(np.int64)
+        self.state = np.zeros((shape[1] + 1, shape[2]), dtype=np.int64)
+        np.cumsum(daily, axis=0, out=self.state[1:])
+
+    # position in the running totals just after each date (0 before the
+    # first administration, the last one after the final one)
+    def _position(self, dates):
+        days = (np.asarray(dates, dtype='datetime64[D]') - \
+        self.first).astype(np.int64) + 1
+        return np.clip(days, 0, self.cumulative.shape[1] - 1)
+
+    # running total positions bounding the dates start through end
+    def _window(self, end, start):
+        stop = -1 if end is None else self._position(pd.Timestamp(end))
+        begin = 0 if start is None else self._position(pd.Timestamp(\
+        start) - pd.Timedelta(days=1))
+        return stop, begin
+
+    # slice of the dose axis for one dose number, or all of them
+    def _doses(self, dose):
+        if dose is None:
+            return slice(None)
+        i = int(np.searchsorted(self.doses, dose))
+        return slice(i, i + 1) if i < len(self.doses) and \
+        self.doses[i] == dose else slice(0, 0)
+
+    # doses given from start through end (both inclusive and optional)
+    # in one locality, or the whole state when locality is None
+    def total(self, locality=None, end=None, start=None, dose=None):
+        if locality is None:
+            running = self.state
+        elif locality in self.rows:
+            running = self.cumulative[self.rows[locality]]
+        else:
+            return 0
+        stop, begin = self._window(end, start)
+        doses = self._doses(dose)
+        return int(running[stop, doses].sum() - running[begin, doses].sum())
+
+    # total() of every locality, indexed by locality
+    def totals(self, end=None, start=None, dose=None):
+        stop, begin = self._window(end, start)
+        doses = self._doses(dose)
+        return pd.Series(self.cumulative[:, stop, doses].sum(axis=1) - \
+        self.cumulative[:, begin, doses].sum(axis=1), index=self.localities)
+
+    # doses given through each date, elementwise over arrays of
+    # localities and dates (0 for localities without any)
+    def through(self, localities, dates, dose=None):
+        localities, dates = np.broadcast_arrays(np.asarray(localities, \
+        dtype=object), np.asarray(dates, dtype='datetime64[D]'))
+        rows = self.localities.get_indexer(localities.ravel()).reshape(\
+        localities.shape)
+        if not len(self.localities):
+            return np.zeros(rows.shape, dtype=np.int64)
+        given = self.cumulative[rows, self._position(dates)]
+        given = given[..., self._doses(dose)].sum(axis=-1)
+        return np.where(rows >= 0, given, 0)
+
+
+# growth over a lookback window, with a zero starting value counted
+# as one
+def growth_rate(curr, prev):
+    return (curr - prev) / np.where(prev == 0, prev + 1, prev)
+
+
+# optimization model inputs for every locality and report date: growth
+# in infected and fatalities since the earliest report in the
+# `months` before, with the infected, fatalities and population the
+# susceptible share is computed from. Doses are left out, since the
+# vaccine feed runs on past the last case report; look them up in the
+# VaccineCube for the date scored. Sorted by locality, then date
+def growth_rates(populations, cases, months=2):
+    cases = cases.sort_values(by=['locality', 'date'], \
+    kind='stable').reset_index(drop=True)
+    codes, localities = pd.factorize(cases['locality'], sort=True)
+    localities = pd.Index(localities)
+    dates = cases['date'].to_numpy(dtype='datetime64[ns]')
+
+    # rows sort by their (locality, day) key, so the first row of the
+    # same locality in each lookback window is a single searchsorted
+    def keys(locality_codes, when):
+        return locality_codes.astype(np.int64) * 10**6 + 500000 + \
+        when.astype('datetime64[D]').astype(np.int64)
+    case_keys = keys(codes, dates)
+    starts = (cases['date'] - pd.DateOffset(months=months)).to_numpy(\
+    dtype='datetime64[ns]')
+    prev = np.searchsorted(case_keys, keys(codes, starts), side='left')
+
+    population = populations.drop_duplicates('locality').set_index(\
+    'locality')['population'].reindex(localities).to_numpy(dtype=float)[codes]
+    infected = cases['infected'].to_numpy()
+    fatalities = cases['fatalities'].to_numpy()
+    return pd.DataFrame({
+        'locality': cases['locality'].to_numpy(),
+        'date': cases['date'].to_numpy(),
+        'infected_rate': growth_rate(infected, infected[prev]),
+        'fatality_rate': growth_rate(fatalities, fatalities[prev]),
+        'infected': infected,
+        'fatalities': fatalities,
+        'population': population
+    })
+
+
+# cross-process lock over downloading the source files and writing the
+# columnar store, so dashboard workers and update_data.py never write
+# the same .part files, staging directory or partitions at once. Held
+# with flock on a file beside the store; blocking=False yields False
+# instead of waiting when another process holds it. Without fcntl
+# (Windows) nothing is locked
+@contextlib.contextmanager
+def store_lock(directory=COLUMNAR_DIR, blocking=True):
+    if fcntl is None:
+        yield True
+        return
+
+    with open(directory + '.lock', 'a') as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX if blocking else \
+            fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+# (mtime, size, sha1) of a file; only re-hashed when its stat changes
+def file_fingerprint(path):
+    st = os.stat(path)
+    cached = _file_hashes.get(path)
+    if cached is not None and cached[:2] == (st.st_mtime_ns, st.st_size):
+        return cached
+
+    sha = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha.update(chunk)
+
+    fingerprint = (st.st_mtime_ns, st.st_size, sha.hexdigest())
+    _file_hashes[path] = fingerprint
+    return fingerprint
+
+
+# fingerprint of every source file the snapshot is built from; files
+# covered by a current columnar store reuse the fingerprint recorded
+# in its manifest rather than being hashed again
+def source_fingerprint():
+    manifest = columnar_manifest()
+    recorded = manifest['sources'] if manifest is not None else {}
+    return tuple(tuple(recorded[name]) if name in recorded else \
+    file_fingerprint(path) for name, path in SOURCE_FILES.items())
+
+
+# short data version derived from the content hashes only, so
+# touching a file without changing it keeps the same version
+def data_version(fingerprint):
+    sha = hashlib.sha1()
+    for _, _, digest in fingerprint:
+        sha.update(digest.encode())
+    return sha.hexdigest()[:12]
+
+
+# one raw VDH dataset ('cases' or 'vaccines'), read with its schema
+def read_raw(name):
+    schema = RAW_SCHEMAS[name]
+    return pd.read_csv(SOURCE_FILES[name], usecols=list(schema), \
+    dtype=schema)
+
+
+# cleaning for the raw VDH cases dataset
+def clean_cases(locality_cases):
+    locality_cases = locality_cases[list(RAW_SCHEMAS['cases'])]
+
+    locality_cases = locality_cases.rename(columns=\
+    {"Report Date": "date","Locality": "locality",\
+    "Total Cases": "confirmed", "Deaths": "fatalities"})
+
+    with instrumentation.span('data.parse_dates'):
+        locality_cases['date'] = pd.to_datetime(locality_cases.date, \
+        format=DATE_FORMAT)
+
+    with instrumentation.span('data.sort'):
+        locality_cases = locality_cases.sort_values(by='date',\
+        ascending=False, ignore_index=True)
+
+    # adding recovered and infected to locality dataset (whole numbers,
+    # exact in float32 below 2**24)
+    locality_cases['recovered'] = \
+    ((locality_cases['confirmed'] * 9) // 10).astype('float32')
+
+    locality_cases['infected'] = (locality_cases['confirmed'] - \
+    locality_cases['recovered'] - locality_cases['fatalities']).astype(\
+    'float32')
+
+    return locality_cases
+
+
+# cleaning for the raw VDH vaccine administrations dataset
+def clean_vaccines(locality_vaccines):
+    locality_vaccines = locality_vaccines[list(RAW_SCHEMAS['vaccines'])]
+
+    locality_vaccines = locality_vaccines.rename(columns=\
+    {"Administration Date": "date", "Locality": "locality",\
+    "Dose Number": "dose", "Vaccine Doses Administered Count": "doses"})
+
+    with instrumentation.span('data.parse_dates'):
+        locality_vaccines['date'] = pd.to_datetime(locality_vaccines.date, \
+        format=DATE_FORMAT)
+    with instrumentation.span('data.sort'):
+        locality_vaccines = locality_vaccines.sort_values(by=\
+        'date',ascending=False, ignore_index=True)
+
+    return locality_vaccines
+
+
+# write the cleaned cases and vaccines tables as typed, date-sorted
+# column arrays, partitioned by month (newest rows first)
+def write_columnar(directory=COLUMNAR_DIR):
+    fingerprint = (file_fingerprint(SOURCE_FILES['cases']), \
+    file_fingerprint(SOURCE_FILES['vaccines']))
+    tables = {
+        'cases': clean_cases(read_raw('cases')),
+        'vaccines': clean_vaccines(read_raw('vaccines'))
+    }
+    localities = sorted(set(tables['cases']['locality'].dropna()) | \
+    set(tables['vaccines']['locality'].dropna()))
+
+    # build next to the live store, then swap it in with a rename
+    staging = directory + '.tmp'
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+
+    manifest = {
+        'format': COLUMNAR_FORMAT,
+        'sources': {'cases': fingerprint[0], 'vaccines': fingerprint[1]},
+        'localities': localities,
+        'tables': {}
+    }
+    for name in COLUMNAR_TABLES:
+        manifest['tables'][name] = {'partitions': {}}
+        _write_rows(staging, manifest, name, tables[name])
+
+    _write_manifest(staging, manifest)
+    shutil.rmtree(directory, ignore_errors=True)
+    os.rename(staging, directory)
+    return manifest
+
+
+# add the source rows dated after the last date already in the store,
+# rewriting only the month partitions they fall in. Dates are parsed
+# once per distinct value and only the new rows are cleaned, sorted
+# and derived; falls back to a full write when there is no store yet
+def append_columnar(directory=COLUMNAR_DIR):
+    manifest = _read_manifest(directory)
+    if manifest is None:
+        return write_columnar(directory)
+    _remove_unreferenced(directory, manifest)
+
+    for name, clean in (('cases', clean_cases), \
+    ('vaccines', clean_vaccines)):
+        raw = read_raw(name)
+        dates = raw[RAW_DATE_COLUMNS[name]]
+        distinct = dates.unique()
+        parsed = pd.to_datetime(pd.Series(distinct), format=DATE_FORMAT)
+        last = pd.Timestamp(manifest['tables'][name]['last_date'])
+        newer = distinct[(parsed > last).to_numpy()]
+
+        delta = clean(raw[dates.isin(newer)])
+        if len(delta):
+            _write_rows(directory, manifest, name, delta)
+        manifest['sources'][name] = file_fingerprint(SOURCE_FILES[name])
+
+    _write_manifest(directory, manifest)
+    _remove_unreferenced(directory, manifest)
+    return manifest
+
+
+# check that the store matches a full rebuild from the source files;
+# returns the names of any tables that differ
+def verify_columnar(directory=COLUMNAR_DIR):
+    rebuilt = directory + '.verify'
+    write_columnar(rebuilt)
+    try:
+        manifest = _read_manifest(directory)
+        expected = _read_manifest(rebuilt)
+
+        mismatched = []
+        for name, columns in COLUMNAR_TABLES.items():
+            by = ['date', 'locality'] + [c for c in columns \
+            if c not in ('date', 'locality')]
+            ours = read_columnar(name, directory=directory, \
+            manifest=manifest).sort_values(by=by).reset_index(drop=True)
+            theirs = read_columnar(name, directory=rebuilt, \
+            manifest=expected).sort_values(by=by).reset_index(drop=True)
+            if not ours.equals(theirs):
+                mismatched.append(name)
+        return mismatched
+    finally:
+        shutil.rmtree(rebuilt, ignore_errors=True)
+
+
+# merge cleaned rows into the month partitions of one table. Every
+# touched month is written to a new directory, so readers holding the
+# old manifest keep seeing the old partition until the manifest swap
+def _write_rows(directory, manifest, name, rows):
+    columns = COLUMNAR_TABLES[name]
+    rows = rows[list(columns)].copy()
+
+    # codes of localities already in the store never change; rows
+    # without a locality keep code -1
+    localities = manifest['localities']
+    for locality in sorted(set(rows['locality'].dropna()) - \
+    set(localities)):
+        localities.append(locality)
+    rows['locality'] = pd.Categorical(rows['locality'], \
+    categories=localities).codes
+
+    table = manifest['tables'][name]
+    partitions = table['partitions']
+    month = rows['date'].dt.strftime('%Y-%m')
+    for part, new_rows in rows.groupby(month, sort=False):
+        if part in partitions:
+            old = partitions[part]
+            old_rows = pd.DataFrame({column: np.load(os.path.join(\
+            directory, name, old['dir'], column + '.npy')) \
+            for column in columns})
+            new_rows = pd.concat([old_rows, new_rows], ignore_index=True)
+            generation = old.get('generation', 0) + 1
+        else:
+            generation = 0
+        new_rows = new_rows.sort_values(by=['date', 'locality'], \
+        ascending=[False, True])
+
+        part_dir = part if generation == 0 else part + '.' + str(generation)
+        os.makedirs(os.path.join(directory, name, part_dir))
+        for column, dtype in columns.items():
+            np.save(os.path.join(directory, name, part_dir, column + '.npy'), \
+            new_rows[column].to_numpy().astype(dtype))
+        partitions[part] = {'rows': len(new_rows), 'dir': part_dir, \
+        'generation': generation}
+
+    # newest month first, as readers expect
+    table['partitions'] = dict(sorted(partitions.items(), reverse=True))
+    last_date = rows['date'].max()
+    if len(rows) and (table.get('last_date') is None or \
+    last_date > pd.Timestamp(table['last_date'])):
+        table['last_date'] = last_date.strftime('%Y-%m-%d')
+
+
+# delete the partition directories the manifest does not point at: the
+# ones it replaced, and any left by an append that failed before its
+# manifest was written, whose names the next append would reuse
+def _remove_unreferenced(directory, manifest):
+    for name, table in manifest['tables'].items():
+        path = os.path.join(directory, name)
+        if not os.path.isdir(path):
+            continue
+        referenced = {part['dir'] for part in table['partitions'].values()}
+        for entry in os.listdir(path):
+            if entry not in referenced:
+                shutil.rmtree(os.path.join(path, entry), ignore_errors=True)
+
+
+def _write_manifest(directory, manifest):
+    path = os.path.join(directory, 'manifest.json')
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f)
+    os.replace(path + '.tmp', path)
+
+
+def _read_manifest(directory):
+    try:
+        with open(os.path.join(directory, 'manifest.json')) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get('format') != COLUMNAR_FORMAT:
+        return None
+    return manifest
+
+
+# manifest of the columnar store, or None when it is missing or was
+# written from different source files than the ones on disk
+def columnar_manifest(directory=COLUMNAR_DIR):
+    manifest = _read_manifest(directory)
+    if manifest is None:
+        return None
+
+    # a csv that is gone is fine, one that changed since is not
+    for name, recorded in manifest['sources'].items():
+        try:
+            st = os.stat(SOURCE_FILES[name])
+        except FileNotFoundError:
+            continue
+        if [st.st_mtime_ns, st.st_size] != recorded[:2]:
+            return None
+    return manifest
+
+
+# load one table of the columnar store into typed in-memory arrays;
+# start and end (inclusive dates) restrict it to the month partitions
+# overlapping them. The partition files are opened memory-mapped only
+# so each column is copied once, straight into its concatenated array;
+# the table itself holds no mapped data
+def read_columnar(name, start=None, end=None, directory=COLUMNAR_DIR, \
+manifest=None):
+    if manifest is None:
+        manifest = columnar_manifest(directory)
+        if manifest is None:
+            raise FileNotFoundError('no up to date columnar store in ' \
+            + directory)
+    table = manifest['tables'][name]
+
+    start_month = None if start is None else \
+    pd.Timestamp(start).strftime('%Y-%m')
+    end_month = None if end is None else pd.Timestamp(end).strftime('%Y-%m')
+    parts = [part for part in table['partitions'] \
+    if (start_month is None or part >= start_month) and \
+    (end_month is None or part <= end_month)]
+
+    columns = {}
+    for column, dtype in COLUMNAR_TABLES[name].items():
+        arrays = [np.load(os.path.join(directory, name, \
+        table['partitions'][part]['dir'], column + '.npy'), \
+        mmap_mode='r') for part in parts]
+        columns[column] = np.concatenate(arrays) if arrays else \
+        np.empty(0, dtype=dtype)
+
+    # locality codes as a categorical with the names in sorted order,
+    # the same layout the csv schema gives
+    names = np.asarray(manifest['localities'], dtype=object)
+    order = np.argsort(names)
+    rank = np.empty(len(names), dtype=np.int16)
+    rank[order] = np.arange(len(names))
+    codes = columns['locality']
+    columns['locality'] = pd.Categorical.from_codes(np.where(codes >= 0, \
+    rank[codes], -1), categories=names[order])
+    frame = pd.DataFrame(columns)
+
+    # month partitions may hold dates just outside the requested range
+    if start is not None:
+        frame = frame[frame['date'] >= pd.Timestamp(start)]
+    if end is not None:
+        frame = frame[frame['date'] <= pd.Timestamp(end)]
+    return frame.reset_index(drop=True)
+
+
+# read and clean every source file into a new snapshot
+def load_snapshot(fingerprint=None):
+    if fingerprint is None:
+        fingerprint = source_fingerprint()
+
+    # cleaned cases and vaccines come from the columnar store when it
+    # is current, and are parsed from the csv files otherwise
+    manifest = columnar_manifest()
+    if manifest is not None:
+        with instrumentation.span('data.read_columnar'):
+            locality_cases = read_columnar('cases', manifest=manifest)
+            locality_vaccines = read_columnar('vaccines', manifest=manifest)
+    else:
+        with instrumentation.span('data.read_csv'):
+            raw_cases = read_raw('cases')
+            raw_vaccines = read_raw('vaccines')
+        locality_cases = clean_cases(raw_cases)
+        locality_vaccines = clean_vaccines(raw_vaccines)
+
+    with instrumentation.span('data.read_csv'):
+        # virginia county population dataset
+        locality_populations = pd.read_csv(SOURCE_FILES['populations'],\
+        names=['locality','population'])
+
+        # virginia county prediction model parameters
+        locality_parameters = pd.read_csv(SOURCE_FILES['parameters'])
+
+    snapshot = Snapshot(data_version(fingerprint), locality_populations, \
+    locality_cases, locality_vaccines, locality_parameters, fingerprint)
+    return snapshot
+
+
+# current snapshot, rebuilt only when the source files have changed
+def get_snapshot():
+    global _snapshot
+
+    snapshot = _snapshot
+    if snapshot is not None and not _auto_reload:
+        return snapshot
+
+    with _lock:
+        fingerprint = source_fingerprint()
+        if _snapshot is None or \
+        data_version(fingerprint) != _snapshot.version:
+            _snapshot = load_snapshot(fingerprint)
+        return _snapshot
+
+
+# new snapshot with its locality index, per-locality totals and growth
+# rates already built, so the first requests against it do no preprocessing
+def build_snapshot():
+    snapshot = load_snapshot()
+    index = snapshot.locality_index()
+    index.totals()
+    index.parameters()
+    index.growth_rates()
+    return snapshot
+
+
+# snapshot currently being served, or None before the first load
+def current_snapshot():
+    return _snapshot
+
+
+# replace the current snapshot. Callers already holding the old one
+# keep using it, so each request sees a single consistent version
+def swap_snapshot(snapshot):
+    global _snapshot
+
+    with _lock:
+        _snapshot = snapshot
+
+
+# turn get_snapshot()'s own source file checks on or off
+def set_auto_reload(enabled):
+    global _auto_reload
+
+    _auto_reload = enabled
+
+
+# get needed VDH data
+def retrieve_input_data():
+    return get_snapshot().tables()
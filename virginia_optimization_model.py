@@ -7,31 +7,42 @@ of each county
 '''
 
 # package imports
-from scipy.integrate import odeint
-import matplotlib.pyplot as plt
+import heapq
 import numpy as np
 import pandas as pd
-import datetime
-import dateutil.relativedelta
-import operator
-from itertools import islice
+from vdh_data import VaccineCube, get_snapshot, growth_rates
+import instrumentation
 
 
-# optimization wrapper function
-def optimize(stockpile):
+# optimization wrapper function; as_of runs it on the data reported up
+# to a past date instead of the latest
+def optimize(stockpile, as_of=None):
 	# get data on cases, population, vaccines, and ODE parameters
-	vdh_data = retrieve_input_data()
+	snapshot = get_snapshot()
+	vdh_data = snapshot.tables()
 
 	locality_populations = vdh_data[0] # population of each county in VA
 	locality_cases = vdh_data[1] # covid cases for each county in VA
 	locality_vaccines = vdh_data[2] # vaccine administration numbers in VA
 	locality_parameters = vdh_data[3] # ODE parameters for each county in VA
 		
-	# run optimization model
-	allocations, priorities = state_optimization_model(stockpile,\
-	locality_populations,locality_cases,locality_vaccines)
+	# run optimization model, with the doses given from the snapshot's
+	# vaccine cube
+	index = snapshot.locality_index()
+	with instrumentation.span('optimize.model'):
+		allocations, priorities = state_optimization_model(stockpile,\
+		locality_populations,locality_cases,index.vaccine_cube(),\
+		as_of=as_of,rates=index.growth_rates())
 	
 	# output optimization results to dashboard, with a bit of preproccessing
+	with instrumentation.span('optimize.frame'):
+		opt_table = optimization_table(allocations, priorities)
+
+	return opt_table
+
+
+# allocation and priority level of each county as a table
+def optimization_table(allocations, priorities):
 	opt_table = {}
 	for key in allocations.keys():
 		cols = []
@@ -55,163 +66,242 @@ def getPriorities(i_scores):
     medium_priority = []
     low_priority = []
     
+    # tier boundaries, 13 and 41 of Virginia's 133 counties
+    count = len(i_scores)
+    high_end = count * 13 // 133
+    medium_end = count * 41 // 133
+
     # top 10% of counties
-    for i in range(0,13):
+    for i in range(0,high_end):
         high_priority.append(i_scores[i])
     
     # next 30% of counties
-    for i in range(13,41):
+    for i in range(high_end,medium_end):
         medium_priority.append(i_scores[i])
     
     # last 60% of counties
-    for i in range(41,133):
+    for i in range(medium_end,count):
         low_priority.append(i_scores[i])
         
     return [high_priority,medium_priority,low_priority]
 
 
-# find good allocation of vaccines and classify counties 
-# by priority level
-def state_optimization_model(stockpile,population,cases,vaccines):
-    
-    # get cases and vaccine dose amounts for each county in VA
-    county_cases = {}
-    county_vaccines = {}
-    for coun in set(cases['locality']):
-        df_cases = cases.loc[cases['locality']==coun]
+# importance score inputs and score for every county as of a report
+# date (the latest by default), looked up in a growth_rates table
+# (vdh_data.growth_rates of the tables unless one is given). vaccines
+# is the vaccines table or its VaccineCube; every dose given up to
+# as_of counts, including those after the county's last case report
+def importance_scores(population,cases,vaccines,as_of=None,rates=None):
+    if rates is None:
+        rates = growth_rates(population,cases)
+    if not isinstance(vaccines, VaccineCube):
+        vaccines = VaccineCube(vaccines)
+
+    # average population of VA
+    average_pop = population['population'].sum()/len(population)
+
+    # each county's latest row up to as_of; rows are sorted by county,
+    # then date
+    if as_of is not None:
+        rates = rates[rates['date'] <= pd.Timestamp(as_of)]
+        if rates.empty:
+            raise ValueError('no case reports on or before ' + str(as_of))
+    scores = rates.groupby('locality').tail(1).set_index('locality')
+    county_pop = scores['population']
+    doses = vaccines.totals(end=as_of).reindex(scores.index, fill_value=0)
+
+    # ratio of people susceptible for infection
+    scores['susceptible'] = (county_pop - scores['infected'] - \
+    scores['fatalities'] - doses) / county_pop
+    scores = scores[['infected_rate', 'fatality_rate', \
+    'susceptible']].copy()
+
+    # importance score formulation
+    scores['importance'] = (((8 * scores['infected_rate']) + \
+    (12 * scores['fatality_rate']) + (4 * scores['susceptible'])) * \
+    (county_pop / average_pop)).astype(int)
+
+    return scores
+
+
+# integer allocations of each stockpile in proportion to weights, one
+# row per stockpile. Every row adds up to its stockpile exactly: shares
+# are rounded down and the leftover doses go to the largest remainders.
+# Negative weights count as zero, and no county gets more than its cap
+# (counties over their cap get the cap and the rest is shared again)
+def allocate_many(weights, stockpiles, caps=None):
+    weights = np.clip(np.asarray(weights, dtype=float), 0, None)
+    stockpiles = np.asarray(stockpiles, dtype=np.int64).reshape(-1)
+    counties = len(weights)
+    caps = np.full(counties, np.inf) if caps is None else \
+    np.floor(np.asarray(caps, dtype=float))
+    if (stockpiles < 0).any():
+        raise ValueError('stockpiles must not be negative')
+    if (stockpiles > caps.sum()).any():
+        raise ValueError('stockpile larger than the sum of the caps')
+    if not weights.any():
+        weights = np.ones(counties)
+
+    # proportional shares, capping counties until none is over its cap
+    rows = np.arange(len(stockpiles))[:, None]
+    capped = np.zeros((len(stockpiles), counties), dtype=bool)
+    while True:
+        remaining = stockpiles - np.where(capped, caps, 0).sum(axis=1)
+        free = np.where(capped, 0, weights)
+        # rows whose uncapped counties all have zero weight share evenly
+        empty = free.sum(axis=1) == 0
+        free[empty] = np.where(capped[empty], 0, 1)
+        total = free.sum(axis=1)
+        shares = np.where(capped, caps, remaining[:, None] * free / \
+        np.where(total == 0, 1, total)[:, None])
+        over = ~capped & (shares > caps)
+        if not over.any():
+            break
+        capped |= over
+
+    # round down, then one more dose for the largest remainders
+    allocations = np.minimum(np.floor(shares), caps)
+    leftover = stockpiles - allocations.sum(axis=1).astype(np.int64)
+    remainders = np.where(allocations < caps, shares - allocations, -1)
+    order = np.argsort(-remainders, axis=1, kind='stable')
+    ranks = np.empty_like(order)
+    ranks[rows, order] = np.arange(counties)
+    allocations += ranks < leftover[:, None]
+    return allocations.astype(np.int64)
+
+
+# integer allocation of one stockpile (see allocate_many), as a Series
+# when weights is one
+def allocate(weights, stockpile, caps=None):
+    allocations = allocate_many(weights, [stockpile], caps)[0]
+    if isinstance(weights, pd.Series):
+        return pd.Series(allocations, index=weights.index)
+    return allocations
+
+
+# per-county caps (a dict or Series) lined up with counties; counties
+# without one are uncapped
+def county_caps(caps, counties):
+    if caps is None:
+        return None
+    return pd.Series(caps, dtype=float).reindex(counties, \
+    fill_value=np.inf).to_numpy()
 
-        df_vaccines = vaccines.loc[\
-		vaccines['locality']==coun].doses.sum() 
-
-        county_cases[coun] = df_cases
-        county_vaccines[coun] = df_vaccines
-    
-    # get importance score for each county
-    importance_scores = {}
 
-	# average population of VA
-    average_pop = sum(population['population'])/len(population) 
-    for coun in set(cases['locality']):
+# find good allocation of vaccines and classify counties 
+# by priority level
+def state_optimization_model(stockpile,population,cases,vaccines,caps=None,\
+as_of=None,rates=None):
 
-		# population of county
-        pop = population[population['locality']==coun].iloc[0].population 
-        
-        # get cases over past 2 months for county
-        df = county_cases[coun]
-        curr_case_date = df['date'].iloc[0].date().strftime("%Y-%m-%d")
-        d = datetime.datetime.strptime(curr_case_date, "%Y-%m-%d")
-        prev_date = d - dateutil.relativedelta.relativedelta(months=2)
-        recent_cases = df[df['date'] >= prev_date]
-        
-        # obtain starting and ending numbers
-        curr_infected = recent_cases.iloc[0].infected
-        curr_fatalities = recent_cases.iloc[0].fatalities
-        prev_infected = int(recent_cases.iloc[len(recent_cases)-1].infected)
-        prev_fatalities = int(recent_cases.iloc[\
-		len(recent_cases)-1].fatalities)
-
-        # rate of infected/deaths for county
-        infected_rate = 0 
-        fatality_rate = 0
-        if prev_infected == 0:
-            infected_rate = (curr_infected - prev_infected)\
-			/ (prev_infected + 1)
-        else:
-            infected_rate = (curr_infected - prev_infected)\
-			/ prev_infected
-
-        if prev_fatalities == 0:
-            fatality_rate = (curr_fatalities - prev_fatalities)\
-			/ (prev_fatalities + 1)
-        else:
-            fatality_rate = (curr_fatalities - prev_fatalities)\
-			/ prev_fatalities 
-    
-         
-        # ratio of people susceptible for infection
-        susc = (pop - curr_infected-curr_fatalities-\
-		county_vaccines[coun]) / pop
+    # importance score for each county, highest first
+    with instrumentation.span('optimize.scores'):
+        importance_scores_sorted = importance_scores(population,cases,\
+        vaccines,as_of,rates)['importance'].sort_values(ascending=False, kind='stable')
 
-        # importance score formulation
-        importance_score = int(((8 * infected_rate) +\
-		(12 * fatality_rate) + (4 * susc))*(pop/average_pop))
+    # allocate exactly the stockpile based on ratio of importance score
+    vaccine_allocations = allocate(importance_scores_sorted, stockpile, \
+    county_caps(caps, importance_scores_sorted.index)).to_dict()
 
-        importance_scores[coun] = importance_score
-        
-    # sort importance scores
-    importance_scores = dict(sorted(importance_scores.items(),\
-	key=operator.itemgetter(1),reverse=True))
-    
-    # ratio of importance scores for each county
-    imp_sum = int(sum(importance_scores.values()))
-    imp_ratios = {}
-    
-    for coun in importance_scores.keys():
-        imp_ratios[coun] = importance_scores[coun] / imp_sum
-        
-    # allocate vaccines based on ratio of importance score
-    vaccine_allocations = {}
-    for coun in imp_ratios.keys():
-        vaccine_allocations[coun] = int(imp_ratios[coun] * stockpile)
-     
     # counties by sorted importance score
-    counties_sorted = list(importance_scores.keys())
-    
+    counties_sorted = list(importance_scores_sorted.index)
+
     # classify each county into 3 categories based on importance score
     vaccine_priorities = getPriorities(counties_sorted)
-    
-    return vaccine_allocations, vaccine_priorities
-
-
-# get needed VDH data
-def retrieve_input_data():
-	
-	# Data Collection and Preprocessing
-	# -----------------------------------
-
-	# locality cases dataset collection and cleaning
-	locality_cases = pd.read_csv('locality_cases.csv')
-
-	locality_cases = locality_cases.drop(columns=\
-	['FIPS', 'Hospitalizations', 'VDH Health District'])
-
-	locality_cases = locality_cases.rename(columns=\
-	{"Report Date": "date","Locality": "locality",\
-	"Total Cases": "confirmed", "Deaths": "fatalities"})
 
-	locality_cases['date'] = pd.to_datetime(locality_cases.date)
-
-	locality_cases = locality_cases.sort_values(by='date',\
-	ascending=False)
-
-	# adding recovered and infected to locality dataset
-	locality_cases['recovered'] = \
-	(locality_cases['confirmed'] * 9) / 10
-
-	locality_cases['recovered'] = \
-	locality_cases['recovered'].astype(int)
-
-	locality_cases['infected'] = locality_cases['confirmed'] - \
-	locality_cases['recovered'] - locality_cases['fatalities']
-
-	# virginia county population dataset
-	locality_populations = pd.read_csv('locality_populations.csv',\
-	names=['locality','population'])
-
-	# virginia vaccine dataset collection and cleaning
-	locality_vaccines = pd.read_csv('locality_vaccines.csv')
-	locality_vaccines = locality_vaccines.drop(columns=['FIPS',\
-	'Health District','Facility Type', 'Vaccine Manufacturer','Dose Number'])
-
-	locality_vaccines = locality_vaccines.rename(columns=\
-	{"Administration Date": "date", "Locality": "locality",\
-	"Vaccine Doses Administered Count": "doses"})
+    return vaccine_allocations, vaccine_priorities
 
-	locality_vaccines['date'] = pd.to_datetime(locality_vaccines.date)
-	locality_vaccines = locality_vaccines.sort_values(by=\
-	'date',ascending=False)
 
-	# virginia county prediction model parameters
-	locality_parameters = pd.read_csv('locality_parameters.csv')
-	
-	return[locality_populations, locality_cases, locality_vaccines,locality_parameters]
+# allocations of every stockpile in stockpiles (one row each, one
+# column per county), from a single importance score computation
+def optimize_sweep(stockpiles, caps=None):
+    snapshot = get_snapshot()
+    population, cases, vaccines, _ = snapshot.tables()
+    index = snapshot.locality_index()
+    scores = importance_scores(population,cases,index.vaccine_cube(),\
+    rates=index.growth_rates())['importance']
+    return pd.DataFrame(allocate_many(scores, stockpiles, \
+    county_caps(caps, scores.index)), index=pd.Index(stockpiles, \
+    name='stockpile'), columns=scores.index)
+
+
+# measure simulated_optimization minimizes, in people, from the state
+# of every system at the start (y0) and end (y) of the horizon
+def simulated_outcome(objective, y0, y, population):
+    if objective == 'fatalities':
+        return (y[:, 3] - y0[:, 3]) * population
+    elif objective == 'infections':
+        return (y[:, 1:4].sum(axis=1) - y0[:, 1:4].sum(axis=1)) * population
+    raise ValueError('unknown objective: ' + str(objective))
+
+
+# allocation of the stockpile that minimizes the predicted fatalities
+# (or infections) over the next `days` days. A county's doses are given
+# out evenly over the horizon, raising its vaccination rate V1 by
+# doses / (population * days). Each county's outcome is simulated at
+# `levels` allocation sizes in one batched solve, the first being its
+# baseline with no extra doses; the stockpile is then handed out in
+# `units` equal parts, each to the county whose interpolated outcome
+# drops the most
+def simulated_optimization(stockpile, scenario=1, days=180, \
+objective='fatalities', caps=None, levels=16, units=1000):
+    from virginia_prediction_model import ODE_METHOD, deriv_batch, \
+    initial_conditions, jacobian_batch, scenario_parameters
+    from ode_solvers import solve
+
+    index = get_snapshot().locality_index()
+    totals = index.totals()
+    params = index.parameters().reindex(totals.index)
+    counties = len(totals)
+    population = totals['population'].to_numpy(dtype=float)
+    y0 = initial_conditions(totals)
+
+    # candidate allocations per county, up to the whole stockpile, its
+    # cap or its susceptible population, whichever is smallest
+    most = np.minimum(float(stockpile), y0[:, 0] * population)
+    capped = county_caps(caps, totals.index)
+    if capped is not None:
+        most = np.minimum(most, capped)
+    grid = most[:, None] * np.linspace(0, 1, levels)[None, :]
+
+    # every county at every level as one stacked system
+    with instrumentation.span('optimize.simulate'):
+        args = [np.repeat(arg, levels) for arg in \
+        scenario_parameters(params, scenario)]
+        args[4] = args[4] + grid.ravel() / (np.repeat(population, levels) \
+        * days)
+        start = np.repeat(y0, levels, axis=0)
+        ret, _ = solve(deriv_batch, start.ravel(), np.array([0, days]), \
+        tuple(args), jac=jacobian_batch, method=ODE_METHOD, bandwidth=4)
+        outcome = simulated_outcome(objective, start, \
+        ret[-1].reshape(-1, 5), np.repeat(population, levels)).reshape(\
+        counties, levels)
+
+    # outcome of each county after 0, 1, 2, ... units, then greedy
+    # marginal gains: every unit goes to the county it helps most
+    with instrumentation.span('optimize.greedy'):
+        unit = stockpile / units
+        steps = np.arange(units + 1) * unit
+        curves = np.array([np.interp(steps, grid[c], outcome[c]) for c in \
+        range(counties)])
+        curves[steps[None, :] > most[:, None] + 1e-9] = np.inf
+        taken = np.zeros(counties, dtype=int)
+        heap = [(curves[c, 1] - curves[c, 0], c) for c in range(counties)]
+        heapq.heapify(heap)
+        for _ in range(units):
+            gain, c = heapq.heappop(heap)
+            if gain == np.inf:
+                break
+            taken[c] += 1
+            if taken[c] < units:
+                heapq.heappush(heap, (curves[c, taken[c] + 1] - \
+                curves[c, taken[c]], c))
+        given = taken * unit
+
+    allocations = allocate(pd.Series(given, index=totals.index), stockpile, \
+    capped)
+    baseline = outcome[:, 0]
+    predicted = np.array([np.interp(allocations.iat[c], grid[c], \
+    outcome[c]) for c in range(counties)])
+    return pd.DataFrame({'vaccine allocation': allocations, \
+    'baseline ' + objective: baseline, 'predicted ' + objective: predicted, \
+    'averted ' + objective: baseline - predicted}, index=totals.index)
@@ -7,10 +7,14 @@ for how many days the user wants
 
 
 # package imports
-from scipy.integrate import odeint
-import matplotlib.pyplot as plt
+from concurrent.futures import ProcessPoolExecutor
+from scipy.sparse import bsr_matrix
 import numpy as np
+import os
 import pandas as pd
+from ode_solvers import solve
+import instrumentation
+from vdh_data import get_snapshot
 
 
 
@@ -18,37 +22,149 @@ import pandas as pd
 def predict(location,scenario,days):
 
     # get data on cases, population, vaccines, and ODE parameters
-    vdh_data = retrieve_input_data()
-
-    locality_populations = vdh_data[0] # population of each county in VA
-    locality_cases = vdh_data[1] # covid cases for each county in VA
-    locality_vaccines = vdh_data[2] # vaccine administration numbers in VA
-    locality_parameters = vdh_data[3] # ODE parameters for each county in VA
-    
+    snapshot = get_snapshot()
 
     # Run prediction model
     # ---------------------------
+    # doses given come from the snapshot's vaccine cube
+    index = snapshot.locality_index()
+    doses = index.vaccine_cube()
+
     pred = 0
     if location == 'Virginia': # prediction for whole state of VA
-        pred = statePrediction(locality_populations, locality_cases, \
-        locality_vaccines, scenario, days) 
+        with instrumentation.span('predict.state'):
+            pred = statePrediction(snapshot.populations, snapshot.cases, \
+            doses.total(), scenario, days) 
 
     else: # prediction for a specific county
         
-        # a bit of preprocessing for specific county data
-        local_population =  locality_populations.loc[\
-        locality_populations['locality']==location]
-        
-        local_cases = locality_cases.loc[locality_cases['locality']==location]
-        
-        local_vaccines = locality_vaccines.loc[\
-        locality_vaccines['locality']==location]
-
-        pred = countyPrediction(location,local_population,local_cases, \
-        local_vaccines, locality_parameters, scenario, days)
+        # county rows come straight out of the snapshot's locality index
+        with instrumentation.span('predict.county'):
+            with instrumentation.span('predict.filter'):
+                local_population = index.slice('populations', location)
+                local_cases = index.latest_cases(location)
+                local_vaccines = doses.total(location)
+                local_parameters = index.slice('parameters', location)
+
+            pred = countyPrediction(location,local_population,local_cases, \
+            local_vaccines, local_parameters, scenario, days)
     return pred
 
 
+# prediction wrapper for many localities at once (all of them by default)
+def predict_all(scenario,days,localities=None):
+
+    # per-locality initial values and ODE parameters
+    index = get_snapshot().locality_index()
+    totals = index.totals()
+    if localities is not None:
+        totals = totals.loc[list(localities)]
+
+    return batchPrediction(totals, index.parameters(), scenario, days)
+
+
+# ODE backend used for every prediction (see ode_solvers.METHODS)
+ODE_METHOD = 'odeint'
+
+# base ODE parameters for the whole state; custom scenarios also take
+# their rho from here
+STATE_PARAMETERS = {
+    'kappa': 0.003590055,
+    'rho': 0.086783753,
+    'sigma': 0.072947592,
+    'theta': 0.00683125
+}
+
+# compartments in the order of the ODE state vector
+COMPARTMENTS = ["Susceptible Population", "Infected with COVID-19", \
+"Recovered from COVID-19", "Fatalities", "Vaccinated Population"]
+
+# process pool reused across ensemble requests, keyed by worker count
+_ensemble_pool = None
+_ensemble_workers = None
+
+
+# percentile bands (p5/p50/p95 by default) of every compartment over
+# `draws` parameter sets sampled around the scenario's parameters.
+# rho, sigma and kappa get lognormal noise with standard deviation
+# `spread`; `distributions` maps any parameter name to a frozen
+# scipy.stats distribution (or an array of draws) to use instead
+def predict_ensemble(location,scenario,days,draws=1000,workers=None,\
+spread=0.25,distributions=None,seed=None,percentiles=(5,50,95)):
+
+    # starting values and base parameters for the location
+    snapshot = get_snapshot()
+    if location == 'Virginia':
+        totals = state_totals(snapshot.populations, snapshot.cases, \
+        snapshot.locality_index().vaccine_cube().total())
+        params = pd.DataFrame(STATE_PARAMETERS, index=['Virginia'])
+    else:
+        index = snapshot.locality_index()
+        totals = index.totals().loc[[location]]
+        params = index.parameters().loc[[location]]
+
+    # sample parameter sets around the scenario's values
+    rng = np.random.default_rng(seed)
+    base = dict(zip(('rho', 'theta', 'sigma', 'kappa', 'V1'), \
+    scenario_parameters(params, scenario)))
+    sampled = {}
+    for name, value in base.items():
+        dist = (distributions or {}).get(name)
+        if dist is None and name in ('rho', 'sigma', 'kappa'):
+            sampled[name] = value[0] * rng.lognormal(0, spread, draws)
+        elif dist is None:
+            sampled[name] = np.full(draws, value[0])
+        elif hasattr(dist, 'rvs'):
+            sampled[name] = dist.rvs(size=draws, random_state=rng)
+        else:
+            sampled[name] = np.resize(np.asarray(dist, dtype=float), draws)
+
+    # A grid of time points (in days)
+    t = np.linspace(0, days, days)
+    y0 = initial_conditions(totals)[0]
+
+    # integrate the draws in chunks, spread over a process pool
+    workers = workers or os.cpu_count() or 1
+    chunks = np.array_split(np.arange(draws), min(workers, draws))
+    jobs = [(y0, t, tuple(sampled[name][chunk] for name in \
+    ('rho', 'theta', 'sigma', 'kappa', 'V1'))) for chunk in chunks]
+    if workers == 1:
+        results = [_solve_draws(*job, ODE_METHOD) for job in jobs]
+    else:
+        results = list(_get_ensemble_pool(workers).map(_solve_draws, \
+        *zip(*jobs), [ODE_METHOD] * len(jobs)))
+    ret = np.concatenate(results, axis=1)
+
+    # percentiles across draws for each day and compartment
+    bands = np.percentile(ret, percentiles, axis=1)
+    temp = pd.DataFrame({"time" : t})
+    for i, name in enumerate(COMPARTMENTS):
+        for p, band in zip(percentiles, bands):
+            temp[name + " p" + str(p)] = band[:, i]
+    return(temp)
+
+
+# shared process pool for ensemble solves
+def _get_ensemble_pool(workers):
+    global _ensemble_pool, _ensemble_workers
+
+    if _ensemble_pool is None or _ensemble_workers != workers:
+        if _ensemble_pool is not None:
+            _ensemble_pool.shutdown()
+        _ensemble_pool = ProcessPoolExecutor(max_workers=workers)
+        _ensemble_workers = workers
+    return _ensemble_pool
+
+
+# integrate one chunk of ensemble draws from the same starting point;
+# returns an array of shape (days, draws, 5)
+def _solve_draws(y0, t, args, method=None):
+    n = len(args[0])
+    ret, _ = solve(deriv_batch, np.tile(y0, n), t, args, \
+    jac=jacobian_batch, method=method or ODE_METHOD, bandwidth=4)
+    return ret.reshape(len(t), n, 5)
+
+
 # ODE function
 def deriv(y, t, rho,theta,sigma,kappa,V1):
     xS, xI, xR, xF, xV = y
@@ -59,15 +175,64 @@ def deriv(y, t, rho,theta,sigma,kappa,V1):
     dxVdt = V1
     return dxSdt, dxIdt, dxRdt, dxFdt, dxVdt
 
+# ODE function for N localities integrated together. y holds the 5
+# states of each locality side by side, so the Jacobian is block
+# diagonal with bandwidth 4 and the solvers can treat it as banded
+def deriv_batch(y, t, rho,theta,sigma,kappa,V1):
+    xS, xI, xR, xF, xV = y.reshape(-1, 5).T
+    infection = rho * xS * xI
+    dy = np.empty((len(xS), 5))
+    dy[:, 0] = -infection - V1
+    dy[:, 1] = (1 - theta) * infection - (sigma + kappa) * xI
+    dy[:, 2] = sigma * xI
+    dy[:, 3] = theta * infection + kappa * xI
+    dy[:, 4] = V1
+    return dy.ravel()
+
+# analytic Jacobian of deriv
+def jacobian(y, t, rho,theta,sigma,kappa,V1):
+    xS, xI, xR, xF, xV = y
+    return np.array([
+        [-rho * xI, -rho * xS, 0, 0, 0],
+        [rho * (1 - theta) * xI, rho * (1 - theta) * xS - (sigma + kappa), \
+        0, 0, 0],
+        [0, sigma, 0, 0, 0],
+        [rho * theta * xI, rho * theta * xS + kappa, 0, 0, 0],
+        [0, 0, 0, 0, 0]])
+
+# analytic Jacobian of deriv_batch, as a sparse block diagonal matrix
+# of one 5 x 5 block per locality
+def jacobian_batch(y, t, rho,theta,sigma,kappa,V1):
+    xS, xI, xR, xF, xV = y.reshape(-1, 5).T
+    n = len(xS)
+    blocks = np.zeros((n, 5, 5))
+    blocks[:, 0, 0] = -rho * xI
+    blocks[:, 0, 1] = -rho * xS
+    blocks[:, 1, 0] = rho * (1 - theta) * xI
+    blocks[:, 1, 1] = rho * (1 - theta) * xS - (sigma + kappa)
+    blocks[:, 2, 1] = sigma
+    blocks[:, 3, 0] = rho * theta * xI
+    blocks[:, 3, 1] = rho * theta * xS + kappa
+    return bsr_matrix((blocks, np.arange(n), np.arange(n + 1)), \
+    shape=(5 * n, 5 * n))
+
+# doses in a vaccines table, or a total already looked up in the
+# snapshot's VaccineCube
+def total_doses(vaccines):
+    if isinstance(vaccines, pd.DataFrame):
+        return vaccines['doses'].sum()
+    return vaccines
+
 # state predictions over period
 def statePrediction(population,cases,vaccines,scenario,period):
     # county data for most recent date
-    most_recent_cases = cases.loc[cases['date']==cases['date'].max()]
+    with instrumentation.span('predict.filter'):
+        most_recent_cases = cases.loc[cases['date']==cases['date'].max()]
 
     # initial values for prediction model
     initial_confirmed = most_recent_cases['confirmed'].sum()
     initial_fatal = most_recent_cases['fatalities'].sum()
-    initial_vaccine = vaccines['doses'].sum()
+    initial_vaccine = total_doses(vaccines)
     initial_recovered = most_recent_cases['recovered'].sum()
     initial_infected = initial_confirmed - \
     initial_fatal - initial_recovered
@@ -88,40 +253,11 @@ def statePrediction(population,cases,vaccines,scenario,period):
     F0 = (initial_fatal / N) 
     
 
-    # pred model ODE parameters
-    kappa = 0
-    rho = 0
-    sigma = 0
-    theta = 0
-    V1 = 0
-        
-    if scenario == 1: # real scenario
-        kappa = 0.003590055
-        rho = 0.086783753 
-        sigma = 0.072947592 
-        theta = 0.00683125
-        V1 = 0.00364
-
-    elif scenario == 0: # bad scenario
-        kappa = 0.003590055 * 2
-        rho = 0.086783753 * 2 
-        sigma = 0.072947592 * 0.5
-        theta = 0.00683125
-        V1 = 0.001
-
-    elif scenario == 2: # good scenario
-        kappa = 0.003590055 * 0.5
-        rho = 0.086783753 * 0.5 
-        sigma = 0.072947592 * 2
-        theta = 0.00683125
-        V1 = 0.01
-        
-    elif isinstance(scenario, dict): # custom scenario
-        kappa = scenario['kappa']
-        rho = 0.086783753 
-        sigma = scenario['sigma']
-        theta = scenario['theta']
-        V1 = scenario['V1']
+    # pred model ODE parameters for the scenario, from the state's
+    # base parameters
+    rho, theta, sigma, kappa, V1 = (float(arg[0]) for arg in \
+    scenario_parameters(pd.DataFrame(STATE_PARAMETERS, \
+    index=['Virginia']), scenario))
 
     V0 = 0
     
@@ -132,11 +268,13 @@ def statePrediction(population,cases,vaccines,scenario,period):
     # Initial conditions vector
     y0 = S0, I0, R0, F0, V0
     # Integrate the SIR equations over the time grid, t.
-    ret = odeint(deriv, y0, t, args=(rho,theta,sigma,kappa,V1))
+    ret, _ = solve(deriv, y0, t, (rho,theta,sigma,kappa,V1), \
+    jac=jacobian, method=ODE_METHOD)
     xS, xI, xR, xF, xV = ret.T
-    temp = pd.DataFrame({"Susceptible Population" : xS, \
-	"Infected with COVID-19" : xI, "Recovered from COVID-19" : xR ,\
-	"Fatalities" : xF, "Vaccinated Population" : xV, "time" :t})
+    with instrumentation.span('predict.frame'):
+        temp = pd.DataFrame({"Susceptible Population" : xS, \
+	    "Infected with COVID-19" : xI, "Recovered from COVID-19" : xR ,\
+	    "Fatalities" : xF, "Vaccinated Population" : xV, "time" :t})
     return(temp)
     
 
@@ -148,7 +286,7 @@ def countyPrediction(county,population,cases,vaccines,params,scenario,period):
     # initial values for prediction model
     initial_confirmed = most_recent_cases['confirmed'].sum()
     initial_fatal = most_recent_cases['fatalities'].sum()
-    initial_vaccine = vaccines['doses'].sum()
+    initial_vaccine = total_doses(vaccines)
     initial_recovered = most_recent_cases['recovered'].sum()
     initial_infected = initial_confirmed - initial_fatal - initial_recovered
 
@@ -168,40 +306,11 @@ def countyPrediction(county,population,cases,vaccines,params,scenario,period):
     F0 = (initial_fatal / N) 
     
 
-    # pred model ODE parameters
-    kappa = 0
-    rho = 0
-    sigma = 0
-    theta = 0
-    V1 = 0
-
-    if scenario == 1: # real scenario
-        kappa = params.loc[params['locality']==county].iloc[0].kappa
-        rho = params.loc[params['locality']==county].iloc[0].rho 
-        sigma = params.loc[params['locality']==county].iloc[0].sigma 
-        theta = params.loc[params['locality']==county].iloc[0].theta
-        V1 = 0.00364
-
-    elif scenario == 0: # bad scenario
-        kappa = params.loc[params['locality']==county].iloc[0].kappa * 2
-        rho = params.loc[params['locality']==county].iloc[0].rho * 2
-        sigma = params.loc[params['locality']==county].iloc[0].sigma * 0.5 
-        theta = params.loc[params['locality']==county].iloc[0].theta
-        V1 = 0.001
-
-    elif scenario == 2: # good scenario
-        kappa = params.loc[params['locality']==county].iloc[0].kappa * 0.5
-        rho = params.loc[params['locality']==county].iloc[0].rho * 0.5
-        sigma = params.loc[params['locality']==county].iloc[0].sigma * 2 
-        theta = params.loc[params['locality']==county].iloc[0].theta
-        V1 = 0.01
-
-    elif isinstance(scenario, dict): # custom scenario
-        kappa = scenario['kappa']
-        rho = 0.086783753 
-        sigma = scenario['sigma']
-        theta = scenario['theta']
-        V1 = scenario['V1']
+    # pred model ODE parameters for the scenario, from the county's
+    # base parameters
+    base = params.loc[params['locality']==county].iloc[:1]
+    rho, theta, sigma, kappa, V1 = (float(arg[0]) for arg in \
+    scenario_parameters(base, scenario))
 
     V0 = 0
 
@@ -212,65 +321,94 @@ def countyPrediction(county,population,cases,vaccines,params,scenario,period):
     # Initial conditions vector
     y0 = S0, I0, R0, F0, V0
     # Integrate the SIR equations over the time grid, t.
-    ret = odeint(deriv, y0, t, args=(rho,theta,sigma,kappa,V1))
+    ret, _ = solve(deriv, y0, t, (rho,theta,sigma,kappa,V1), \
+    jac=jacobian, method=ODE_METHOD)
     xS, xI, xR, xF, xV = ret.T
 
-    temp = pd.DataFrame({"Susceptible Population" : xS, \
-	"Infected with COVID-19" : xI, "Recovered from COVID-19" : xR ,\
-	"Fatalities" : xF, "Vaccinated Population" : xV, "time" :t})
+    with instrumentation.span('predict.frame'):
+        temp = pd.DataFrame({"Susceptible Population" : xS, \
+	    "Infected with COVID-19" : xI, "Recovered from COVID-19" : xR ,\
+	    "Fatalities" : xF, "Vaccinated Population" : xV, "time" :t})
 
     return(temp)
 
 
-# get needed VDH data
-def retrieve_input_data():
-    
-    # Data Collection and Preprocessing
-    # -----------------------------------
+# whole-state forecast starting values, computed the same way as in
+# statePrediction, as a one-row totals frame
+def state_totals(population,cases,vaccines):
+    most_recent_cases = cases.loc[cases['date']==cases['date'].max()]
+    return pd.DataFrame({
+        'confirmed': [most_recent_cases['confirmed'].sum()],
+        'fatalities': [most_recent_cases['fatalities'].sum()],
+        'recovered': [most_recent_cases['recovered'].sum()],
+        'doses': [total_doses(vaccines)],
+        'population': [population['population'].sum()]
+    }, index=['Virginia'])
+
+
+# ODE parameters for a scenario, elementwise over arrays of base
+# parameters; the one definition of the scenarios, used by every
+# prediction
+def scenario_parameters(params,scenario):
+    kappa = params['kappa'].to_numpy()
+    rho = params['rho'].to_numpy()
+    sigma = params['sigma'].to_numpy()
+    theta = params['theta'].to_numpy()
+    ones = np.ones(len(params))
 
-    # locality cases dataset collection and cleaning
-    locality_cases = pd.read_csv('locality_cases.csv')
+    if scenario == 1: # real scenario
+        return rho, theta, sigma, kappa, 0.00364 * ones
 
-    locality_cases = locality_cases.drop(columns=\
-    ['FIPS', 'Hospitalizations', 'VDH Health District'])
+    elif scenario == 0: # bad scenario
+        return rho * 2, theta, sigma * 0.5, kappa * 2, 0.001 * ones
 
-    locality_cases = locality_cases.rename(columns=\
-    {"Report Date": "date","Locality": "locality",\
-    "Total Cases": "confirmed", "Deaths": "fatalities"})
+    elif scenario == 2: # good scenario
+        return rho * 0.5, theta, sigma * 2, kappa * 0.5, 0.01 * ones
 
-    locality_cases['date'] = pd.to_datetime(locality_cases.date)
+    elif isinstance(scenario, dict): # custom scenario
+        return STATE_PARAMETERS['rho'] * ones, scenario['theta'] * ones, \
+        scenario['sigma'] * ones, scenario['kappa'] * ones, \
+        scenario['V1'] * ones
 
-    locality_cases = locality_cases.sort_values(by='date',\
-    ascending=False)
+    return ones * 0, ones * 0, ones * 0, ones * 0, ones * 0
 
-    # adding recovered and infected to locality dataset
-    locality_cases['recovered'] = \
-    (locality_cases['confirmed'] * 9) / 10
 
-    locality_cases['recovered'] = \
-    locality_cases['recovered'].astype(int)
+# normalized initial conditions (one row per locality), computed the
+# same way as in countyPrediction
+def initial_conditions(totals):
+    N = totals['population'].to_numpy()
+    initial_infected = totals['confirmed'].to_numpy() - \
+    totals['fatalities'].to_numpy() - totals['recovered'].to_numpy()
 
-    locality_cases['infected'] = locality_cases['confirmed'] - \
-    locality_cases['recovered'] - locality_cases['fatalities']
+    I0 = initial_infected / N
+    R0 = totals['recovered'].to_numpy() / N
+    V0 = totals['doses'].to_numpy() / N
+    S0 = (N - I0 - R0 - V0) / N
+    F0 = totals['fatalities'].to_numpy() / N
+    return np.column_stack((S0, I0, R0, F0, np.zeros(len(N))))
 
-    # virginia county population dataset
-    locality_populations = pd.read_csv('locality_populations.csv',\
-    names=['locality','population'])
 
-    # virginia vaccine dataset collection and cleaning
-    locality_vaccines = pd.read_csv('locality_vaccines.csv')
-    locality_vaccines = locality_vaccines.drop(columns=['FIPS',\
-    'Health District','Facility Type', 'Vaccine Manufacturer','Dose Number'])
+# predictions for every locality in `totals` over period, solved as
+# one stacked system; returns one row per locality and day
+def batchPrediction(totals,params,scenario,period):
+    params = params.reindex(totals.index)
+    args = scenario_parameters(params, scenario)
 
-    locality_vaccines = locality_vaccines.rename(columns=\
-    {"Administration Date": "date", "Locality": "locality",\
-    "Vaccine Doses Administered Count": "doses"})
+    # A grid of time points (in days)
+    t = np.linspace(0, period, period)
 
-    locality_vaccines['date'] = pd.to_datetime(locality_vaccines.date)
-    locality_vaccines = locality_vaccines.sort_values(by=\
-    'date',ascending=False)
+    # Integrate all localities' SIR equations over the time grid, t.
+    y0 = initial_conditions(totals)
+    ret, _ = solve(deriv_batch, y0.ravel(), t, args, jac=jacobian_batch, \
+    method=ODE_METHOD, bandwidth=4)
+    ret = ret.reshape(len(t), len(totals), 5)
 
-    # virginia county prediction model parameters
-    locality_parameters = pd.read_csv('locality_parameters.csv')
-    
-    return[locality_populations, locality_cases, locality_vaccines,locality_parameters]
+    # tidy layout: localities one after another, days within each
+    ret = ret.transpose(1, 0, 2).reshape(-1, 5)
+    temp = pd.DataFrame({"locality" : np.repeat(totals.index.to_numpy(), \
+    len(t)), "Susceptible Population" : ret[:, 0], \
+    "Infected with COVID-19" : ret[:, 1], \
+    "Recovered from COVID-19" : ret[:, 2], "Fatalities" : ret[:, 3], \
+    "Vaccinated Population" : ret[:, 4], "time" : np.tile(t, len(totals))})
+
+    return(temp)